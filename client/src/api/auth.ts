@@ -14,7 +14,7 @@ export const register = async (data: FormData) => {
       groq_api_key: "",
     });
     if (response.data.token) {
-      // localStorage.setItem("token", response.data.token);
+      localStorage.setItem("token", response.data.token);
       localStorage.setItem("user", JSON.stringify(response.data.data));
     }
     return response;
@@ -30,11 +30,12 @@ export const login = async (data: {
   username: string | null;
   password: string | null;
   GoogleLogin: boolean;
+  idToken?: string;
 }) => {
   try {
     const response = await api.post("/login", data);
     if (response.data.token) {
-      // localStorage.setItem("token", response.data.token);
+      localStorage.setItem("token", response.data.token);
       localStorage.setItem("user", JSON.stringify(response.data.data));
     }
     return response;
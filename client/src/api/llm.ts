@@ -3,6 +3,36 @@ import axios from "axios";
 
 const BASE_URL = "http://localhost:8000/llm";
 
+// The session token lets the server apply its per-user limits
+axios.interceptors.request.use((config) => {
+  const token = localStorage.getItem("token");
+  if (token && config.url?.startsWith(BASE_URL)) {
+    config.headers.Authorization = `Bearer ${token}`;
+  }
+  return config;
+});
+
+// Read endpoints answer 304 with an ETag when nothing changed, so the last
+// body is kept per request and reused
+const etagCache = new Map<string, { etag: string; data: any }>();
+
+const conditionalPost = async (url: string, body: object) => {
+  const key = `${url} ${JSON.stringify(body)}`;
+  const cached = etagCache.get(key);
+  const response = await axios.post(url, body, {
+    headers: cached ? { "If-None-Match": cached.etag } : {},
+    validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+  });
+  if (response.status === 304 && cached) {
+    return { ...response, status: 200, data: cached.data };
+  }
+  const etag = response.headers["etag"];
+  if (etag) {
+    etagCache.set(key, { etag, data: response.data });
+  }
+  return response;
+};
+
 export const update_api_key = async (id: string, key: string) => {
   const response = await axios.post(`${BASE_URL}/update-groq`, {
     id,
@@ -116,9 +146,40 @@ export const new_chat = async (
   }
 };
 
+// Chat over a WebSocket that keeps the conversation's context on the server.
+// Tokens arrive through onToken, the persisted message ids through onDone.
+export const open_chat_session = (
+  conv_id: string,
+  handlers: {
+    onReady?: () => void;
+    onToken: (token: string) => void;
+    onDone: (messageIds: string[]) => void;
+    onError: (error: string) => void;
+    onClose?: (reason: string) => void;
+  }
+) => {
+  const token = localStorage.getItem("token") || "";
+  const socket = new WebSocket(
+    `${BASE_URL.replace(/^http/, "ws")}/chat/${conv_id}?token=${encodeURIComponent(token)}`
+  );
+  socket.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    if (message.type === "ready") handlers.onReady?.();
+    else if (message.type === "token") handlers.onToken(message.data);
+    else if (message.type === "done") handlers.onDone(message.messageIds);
+    else if (message.type === "error") handlers.onError(message.error);
+  };
+  socket.onclose = (event) => handlers.onClose?.(event.reason);
+  return {
+    send: (query: string, mode: "normal" | "file" = "normal") =>
+      socket.send(JSON.stringify({ type: "chat", query, mode })),
+    close: () => socket.close(),
+  };
+};
+
 export const get_convos = async (ids: string[]) => {
   try {
-    const response = await axios.post(`${BASE_URL}/get-convos`, {
+    const response = await conditionalPost(`${BASE_URL}/get-convos`, {
       ids,
     });
     return response;
@@ -131,7 +192,7 @@ export const get_convos = async (ids: string[]) => {
 
 export const get_messages = async (id: string, userId: string) => {
   try {
-    const response = await axios.post(
+    const response = await conditionalPost(
       `${BASE_URL}/get-messages`,
       {
         id,
@@ -148,7 +209,7 @@ export const get_messages = async (id: string, userId: string) => {
 
 export const get_conv_details = async (ids: string[]) => {
   try {
-    const response = await axios.post(
+    const response = await conditionalPost(
       `${BASE_URL}/get-conv-details`,
       {
         ids,
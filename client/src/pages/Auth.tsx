@@ -13,6 +13,7 @@ export interface FormData {
   email?: string;
   password: string | null;
   GoogleRegister: boolean;
+  idToken?: string;
 }
 
 export default function Auth() {
@@ -114,6 +115,7 @@ export default function Auth() {
           email: user.email,
           password: null,
           GoogleRegister: true,
+          idToken: await user.getIdToken(),
         });
         if (res.status === 200) {
           localStorage.setItem("user", JSON.stringify(res.data.data));
@@ -151,6 +153,7 @@ export default function Auth() {
           username: user.displayName || user.email.split("@")[0],
           password: null,
           GoogleLogin: true,
+          idToken: await user.getIdToken(),
         });
         if (res.status === 200 && res.data.data) {
           setUser(res.data.data);
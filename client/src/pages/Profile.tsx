@@ -71,6 +71,7 @@ export default function Profile() {
   const Logout = () => {
     setUser(null);
     localStorage.removeItem("user");
+    localStorage.removeItem("token");
     router("/auth?mode=login");
   };
   return (
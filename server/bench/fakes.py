@@ -0,0 +1,277 @@
+"""
+Offline stand-ins for the services the server talks to: Mongo (mongomock),
+the Pinecone vector store, the Groq chat model and, when the real models are
+not cached locally, the embedding and OCR models.
+
+install() patches them into the already imported server modules and returns
+the FastAPI app, so benchmarks exercise the real route and pipeline code.
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+# Never reach out to the network: no Hugging Face downloads, no index pool
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+os.environ.setdefault("INDEX_POOL_SIZE", "0")
+
+import mongomock
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+DIMENSION = 384
+
+
+class FakeIndex:
+    def __init__(self, name: str):
+        self.name = name
+        self.ids = []
+        self.vectors = np.zeros((0, DIMENSION), dtype=np.float32)
+        self.metadata = {}
+        self.lock = threading.Lock()
+
+    def describe_index_stats(self):
+        return {"dimension": DIMENSION, "total_vector_count": len(self.ids)}
+
+    def upsert(self, vectors):
+        with self.lock:
+            values = np.array([v["values"] for v in vectors], dtype=np.float32)
+            self.vectors = np.vstack([self.vectors, values])
+            for v in vectors:
+                self.ids.append(v["id"])
+                self.metadata[v["id"]] = v.get("metadata", {})
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        with self.lock:
+            if delete_all:
+                self.ids, self.metadata = [], {}
+                self.vectors = np.zeros((0, DIMENSION), dtype=np.float32)
+                return
+            keep = [i for i, id in enumerate(self.ids) if id not in set(ids or [])]
+            self.vectors = self.vectors[keep]
+            self.ids = [self.ids[i] for i in keep]
+            for id in ids or []:
+                self.metadata.pop(id, None)
+
+    def list(self, prefix=None, limit=100, **kwargs):
+        with self.lock:
+            ids = [id for id in self.ids if not prefix or id.startswith(prefix)]
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def fetch(self, ids, **kwargs):
+        with self.lock:
+            return SimpleNamespace(vectors={
+                id: SimpleNamespace(id=id, values=self.vectors[self.ids.index(id)].tolist(), metadata=self.metadata[id])
+                for id in ids if id in self.metadata
+            })
+
+    def query(self, vector, top_k=10, include_metadata=False, **kwargs):
+        with self.lock:
+            if not self.ids:
+                return {"matches": []}
+            q = np.asarray(vector, dtype=np.float32)
+            norms = np.linalg.norm(self.vectors, axis=1) * (np.linalg.norm(q) or 1.0)
+            scores = self.vectors @ q / np.where(norms == 0, 1.0, norms)
+            best = np.argsort(-scores)[:top_k]
+            return {"matches": [{
+                "id": self.ids[i],
+                "score": float(scores[i]),
+                **({"metadata": self.metadata[self.ids[i]]} if include_metadata else {}),
+            } for i in best]}
+
+
+class NotFound(Exception):
+    # Stands in for pinecone.exceptions.NotFoundException
+    status = 404
+
+
+class FakePinecone:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.indexes = {}
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def Index(self, name: str):
+        if name not in self.indexes:
+            raise NotFound(f"Index {name} not found")
+        index = self.indexes[name]
+        if self.latency:
+            return _SlowIndex(index, self.latency)
+        return index
+
+    def create_index(self, name: str, **kwargs):
+        self._wait()
+        if name in self.indexes:
+            raise Exception(f"Index {name} already exists")
+        self.indexes[name] = FakeIndex(name)
+
+    def delete_index(self, name: str):
+        self._wait()
+        if name not in self.indexes:
+            raise NotFound(f"Index {name} not found")
+        del self.indexes[name]
+
+    def list_indexes(self):
+        return SimpleNamespace(names=lambda: list(self.indexes))
+
+    def describe_index(self, name: str):
+        return SimpleNamespace(name=name, status={"ready": name in self.indexes})
+
+
+class _SlowIndex:
+    # Adds a fixed network round-trip to every vector store call
+    def __init__(self, index: FakeIndex, latency: float):
+        self.index = index
+        self.latency = latency
+
+    def __getattr__(self, attr):
+        method = getattr(self.index, attr)
+
+        def call(*args, **kwargs):
+            time.sleep(self.latency)
+            return method(*args, **kwargs)
+        return call
+
+
+class FakeChatModel:
+    """Replaces ChatGroq; every invoke sleeps for `latency` seconds."""
+
+    latency = 0.0
+    tokens = 200
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def _reply(self, messages) -> str:
+        prompt = messages[-1].content if messages else ""
+        return "# Answer\n\n" + " ".join(["lorem"] * self.tokens) + f"\n\n({len(prompt)} prompt chars)"
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self.latency)
+        return AIMessage(content=self._reply(messages))
+
+    def stream(self, messages, **kwargs):
+        time.sleep(self.latency)
+        for word in self._reply(messages).split(" "):
+            yield AIMessageChunk(content=word + " ")
+
+
+class HashingEmbeddings:
+    """Deterministic 384-dim bag-of-words embeddings, used when the real model is not cached."""
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), DIMENSION), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                out[row, int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % DIMENSION] += 1.0
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-6)
+        return out[0] if single else out
+
+    def get_sentence_embedding_dimension(self):
+        return DIMENSION
+
+
+class FakeOCR:
+    def readtext(self, array):
+        time.sleep(0.001)
+        return [(None, "synthetic image text", 0.99)]
+
+
+def _set_lazy(lazy, value):
+    lazy.value, lazy.state, lazy.error = value, "ready", None
+
+
+def install(models: str = "auto", llm_latency: float = 0.0, vector_latency: float = 0.0) -> dict:
+    """
+    Patches the server modules with the offline stand-ins. `models` is
+    "real", "fake" or "auto" (real when cached locally, fake otherwise).
+    Returns the app plus what was actually installed.
+    """
+    import app as app_module
+    import pineconedb
+    from llm import model as llm_model, extractors, embeddings, index_pool
+    from routes import llm as llm_routes, auth as auth_routes
+    import cleanup
+    from llm import chunk_store
+
+    client = mongomock.MongoClient()
+    for mongo in {id(m): m for m in (llm_routes.db, auth_routes.db, app_module.db, index_pool.mongo, cleanup.mongo, chunk_store.mongo)}.values():
+        mongo.client, mongo.db = client, client["Docquer"]
+    index_pool.pool = client["Docquer"]["IndexPool"]
+    index_pool._indexed = False
+    index_pool._names.clear()
+
+    pinecone = FakePinecone(latency=vector_latency)
+    _set_lazy(pineconedb.pinecone_client, pinecone)
+
+    FakeChatModel.latency = llm_latency
+    llm_model.ChatGroq = FakeChatModel
+
+    installed = {"embeddings": "fake", "ocr": "fake"}
+    if models in ("real", "auto"):
+        try:
+            embeddings.embeddings_model.get()
+            installed["embeddings"] = embeddings.EMBEDDING_BACKEND
+        except Exception as e:
+            if models == "real":
+                raise
+            print(f"Real embedding model unavailable offline ({e}), using hashing embeddings")
+        try:
+            extractors.ocr_reader.get()
+            installed["ocr"] = "easyocr"
+        except Exception as e:
+            if models == "real":
+                raise
+            print(f"Real OCR model unavailable offline ({e}), using fake OCR")
+    if installed["embeddings"] == "fake":
+        _set_lazy(embeddings.embeddings_model, HashingEmbeddings())
+    if installed["ocr"] == "fake":
+        _set_lazy(extractors.ocr_reader, FakeOCR())
+
+    return {"app": app_module.app, "mongo": client["Docquer"], "pinecone": pinecone, "models": installed}
+
+
+def seed_user(mongo, username: str = "bench", api_key: str = "fake-key") -> str:
+    return str(mongo["users"].insert_one({
+        "username": username,
+        "email": f"{username}@example.com",
+        "groq_api_key": api_key,
+        "convos": [],
+    }).inserted_id)
+
+
+def seed_conversation(mongo, username: str = "bench", messages: int = 0) -> str:
+    ids = []
+    for i in range(messages):
+        ids.append(str(mongo["Message"].insert_one({
+            "sender": "user" if i % 2 == 0 else "bot",
+            "text": f"previous message {i} " * 20,
+        }).inserted_id))
+    conv_id = str(mongo["convos"].insert_one({
+        "username": username,
+        "fileName": None,
+        "fileMime": None,
+        "title": "bench",
+        "subTitle": "bench",
+        "firstMessage": "hello",
+        "createTime": datetime.now(),
+        "messages": ids,
+        "version": 0,
+    }).inserted_id)
+    mongo["users"].update_one({"username": username}, {"$push": {"convos": conv_id}})
+    return conv_id
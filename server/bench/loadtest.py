@@ -0,0 +1,247 @@
+"""
+Concurrent load generator for the API, using the offline stand-ins from
+bench/fakes.py.
+
+    cd server && python -m bench.loadtest [--mix mixed | --mix chat=4,upload=1]
+                                          [--users 20] [--duration 30]
+                                          [--llm-latency 0.5] [--uvicorn]
+
+By default the app is driven in-process through httpx's ASGI transport, so
+the load generator shares the app's event loop. With --uvicorn the app runs
+in a real uvicorn server on a background thread and is driven over HTTP.
+Either way a probe task on the app's loop samples event-loop lag, and the
+report gives p50/p95/p99 per endpoint plus lag percentiles for the mix.
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from bson import ObjectId
+
+from . import fakes, synthetic
+
+MIXES = {
+    "chat": {"chat": 1},
+    "mixed": {"chat": 4, "file-chat": 4, "history": 4, "upload": 1},
+    "upload-heavy": {"chat": 2, "file-chat": 2, "history": 2, "upload": 3},
+    "reads": {"history": 1},
+}
+
+
+class LagProbe:
+    """Measures how late a periodic sleep wakes up on the loop it runs on."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def reset(self):
+        self.samples = []
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000, 2)
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99), "max_ms": round(values[-1] * 1000, 2)}
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    if spec in MIXES:
+        return MIXES[spec]
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight or 1)
+    unknown = set(mix) - {"chat", "file-chat", "history", "upload"}
+    if unknown:
+        raise SystemExit(f"Unknown operations in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class Workload:
+    # One per virtual user. Queries differ per user and per request, and each
+    # user uploads its own payload into its own conversation, so identical
+    # in-flight requests aren't coalesced (see singleflight.py) and every
+    # request does its own work.
+    def __init__(self, client, number: int, user_id: str, conv_id: str, upload_conv_id: str,
+                 message_ids: List[str], upload: bytes):
+        self.client = client
+        self.number = number
+        self.user_id = user_id
+        self.conv_id = conv_id
+        self.upload_conv_id = upload_conv_id
+        self.message_ids = message_ids
+        self.upload = upload + f"% bench user {number}\n".encode()
+        self.requests = 0
+
+    def query(self, text: str) -> str:
+        self.requests += 1
+        return f"{text} (user {self.number}, request {self.requests})"
+
+    async def chat(self):
+        return await self.client.post("/llm/normal-chat", json={
+            "username": "bench", "query": self.query("explain the revenue table"),
+            "conv_id": self.conv_id, "messageIds": self.message_ids})
+
+    async def file_chat(self):
+        return await self.client.post("/llm/file-chat", json={
+            "username": "bench", "query": self.query("what does the document say about churn"),
+            "conv_id": self.conv_id, "messageIds": self.message_ids})
+
+    async def history(self):
+        return await self.client.post("/llm/get-messages", json={"id": self.conv_id, "userId": self.user_id})
+
+    async def upload_file(self):
+        return await self.client.post(
+            "/llm/upload-file",
+            data={"conv_id": self.upload_conv_id},
+            files={"file": ("bench.pdf", self.upload, synthetic.MIME["pdf"])})
+
+    def op(self, name: str):
+        return {"chat": self.chat, "file-chat": self.file_chat, "history": self.history, "upload": self.upload_file}[name]
+
+
+async def virtual_user(workload: Workload, mix: Dict[str, int], deadline: float, latencies, errors, rng):
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            res = await workload.op(name)()
+            ok = res.status_code < 400
+        except Exception:
+            ok = False
+        latencies[name].append(time.perf_counter() - started)
+        if not ok:
+            errors[name] += 1
+
+
+def seed(env: dict, upload: bytes, users: int):
+    from llm.model import create_index
+    mongo = env["mongo"]
+    user_id = fakes.seed_user(mongo)
+    conv_id = fakes.seed_conversation(mongo, messages=10)
+    upload_conv_ids = [fakes.seed_conversation(mongo) for _ in range(users)]
+    create_index(upload, synthetic.MIME["pdf"], conv_id)
+    message_ids = mongo["convos"].find_one({"_id": ObjectId(conv_id)})["messages"]
+    return user_id, conv_id, upload_conv_ids, message_ids
+
+
+async def drive(base_url: str, transport, seeded, upload: bytes, mix, users: int, duration: float, seed_value: int):
+    import httpx
+    latencies, errors = defaultdict(list), defaultdict(int)
+    user_id, conv_id, upload_conv_ids, message_ids = seeded
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=120) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*[
+            virtual_user(Workload(client, i, user_id, conv_id, upload_conv_ids[i], message_ids, upload),
+                         mix, deadline, latencies, errors, random.Random(seed_value + i))
+            for i in range(users)
+        ])
+    return latencies, errors
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_uvicorn(app, probe: LagProbe) -> str:
+    import uvicorn
+    app.add_event_handler("startup", probe.start)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="uvicorn", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def report(mix_name: str, latencies, errors, lag: List[float], duration: float) -> dict:
+    endpoints = {}
+    for name, values in sorted(latencies.items()):
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "rps": round(len(values) / duration, 2),
+            **percentiles(values),
+        }
+    return {"mix": mix_name, "endpoints": endpoints, "event_loop_lag": {
+        "samples": len(lag), "mean_ms": round(statistics.mean(lag) * 1000, 2) if lag else None, **percentiles(lag)}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", action="append", help=f"preset ({', '.join(MIXES)}) or op=weight list; repeatable")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per mix")
+    parser.add_argument("--upload-pages", type=int, default=40)
+    parser.add_argument("--models", choices=["auto", "real", "fake"], default="auto")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--vector-latency", type=float, default=0.02)
+    parser.add_argument("--uvicorn", action="store_true", help="serve the app with uvicorn and drive it over HTTP")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    env = fakes.install(models=args.models, llm_latency=args.llm_latency, vector_latency=args.vector_latency)
+    upload = synthetic.make_pdf(args.upload_pages)
+    seeded = seed(env, upload, args.users)
+    probe = LagProbe()
+
+    import httpx
+    if args.uvicorn:
+        base_url, transport = start_uvicorn(env["app"], probe), httpx.AsyncHTTPTransport()
+    else:
+        base_url, transport = "http://bench", httpx.ASGITransport(app=env["app"])
+
+    async def run_mix(mix_name: str):
+        if not args.uvicorn and probe.task is None:
+            probe.start()
+        probe.reset()
+        latencies, errors = await drive(base_url, transport, seeded, upload, parse_mix(mix_name),
+                                        args.users, args.duration, args.seed)
+        return report(mix_name, latencies, errors, list(probe.samples), args.duration)
+
+    async def run_all():
+        return [await run_mix(mix) for mix in args.mix or ["mixed"]]
+
+    results = asyncio.run(run_all())
+    for result in results:
+        print(f"\n== {result['mix']} ({args.users} users, {args.duration}s{', uvicorn' if args.uvicorn else ''})")
+        for name, stats in result["endpoints"].items():
+            print(f"  {name:10} n={stats['requests']:<6} err={stats['errors']:<4} rps={stats['rps']:<8} "
+                  f"p50={stats.get('p50_ms')}ms p95={stats.get('p95_ms')}ms p99={stats.get('p99_ms')}ms")
+        lag = result["event_loop_lag"]
+        print(f"  loop lag   mean={lag['mean_ms']}ms p50={lag.get('p50_ms')}ms p99={lag.get('p99_ms')}ms max={lag.get('max_ms')}ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Offline benchmarks for the ingestion and chat hot paths.
+
+    cd server && python -m bench.run [--repeat 5] [--models auto|real|fake]
+                                     [--llm-latency 0.05] [--fail-on-regression]
+
+Every run is appended to bench/history.json together with the git revision
+and compared with the latest earlier run that used the same models; a median
+slower by more than --threshold is reported as a regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+from . import fakes, synthetic
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json")
+
+
+def measure(fn: Callable, repeat: int, **extra) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+        **extra,
+    }
+
+
+async def measure_async(fn, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - started)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+    }
+
+
+def bench_extraction(docs: dict, repeat: int) -> dict:
+    from llm.extractors import getFileText
+    return {
+        f"getFileText[{kind}]": measure(lambda: getFileText(data, synthetic.MIME[kind]), repeat, bytes=len(data))
+        for kind, data in docs.items()
+    }
+
+
+def bench_chunking(docs: dict, repeat: int) -> dict:
+    from llm.constants import split_into_chunks
+    from llm.extractors import getFileText
+    text = getFileText(docs["pdf"], synthetic.MIME["pdf"])
+    chunks = split_into_chunks(text)
+    return {"split_into_chunks": measure(lambda: split_into_chunks(text), repeat, chars=len(text), chunks=len(chunks))}
+
+
+def bench_embedding(repeat: int) -> dict:
+    from llm.embeddings import encode_by_length, get_embeddings_model, sample_sentences
+    sentences = sample_sentences(256)
+    result = measure(lambda: get_embeddings_model().encode(sentences), repeat, sentences=len(sentences))
+    result["sentences_per_second"] = round(len(sentences) / (result["median_ms"] / 1000), 1)
+    by_length = measure(lambda: encode_by_length(sentences), repeat, sentences=len(sentences))
+    by_length["sentences_per_second"] = round(len(sentences) / (by_length["median_ms"] / 1000), 1)
+    return {"embed": result, "embed_by_length": by_length}
+
+
+def bench_insert(docs: dict, repeat: int) -> dict:
+    from llm.constants import init_vector_db, stream_chunks
+    from llm.extractors import extract
+    from llm.pipeline import insert_data
+    conv_id = "bench-insert"
+    init_vector_db(conv_id)
+    count = {}
+
+    def run():
+        count["chunks"] = insert_data(conv_id, stream_chunks(extract(docs["pdf"], synthetic.MIME["pdf"])), replace=True)
+    result = measure(run, repeat)
+    result["chunks"] = count["chunks"]
+    return {"insert_data[pdf]": result}
+
+
+async def bench_routes(env: dict, docs: dict, repeat: int) -> dict:
+    import httpx
+    from llm.model import create_index
+    mongo = env["mongo"]
+    fakes.seed_user(mongo)
+    conv_id = fakes.seed_conversation(mongo, messages=10)
+    create_index(docs["pdf"], synthetic.MIME["pdf"], conv_id)
+    message_ids = mongo["convos"].find_one()["messages"]
+
+    transport = httpx.ASGITransport(app=env["app"])
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def normal():
+            res = await client.post("/llm/normal-chat", json={
+                "username": "bench", "query": "summarise revenue growth",
+                "conv_id": conv_id, "messageIds": message_ids})
+            res.raise_for_status()
+
+        async def file():
+            res = await client.post("/llm/file-chat", json={
+                "username": "bench", "query": "what does the document say about churn",
+                "conv_id": conv_id, "messageIds": message_ids})
+            res.raise_for_status()
+
+        return {
+            "/llm/normal-chat": await measure_async(normal, repeat),
+            "/llm/file-chat": await measure_async(file, repeat),
+        }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(HISTORY)).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def load_history() -> list:
+    if not os.path.exists(HISTORY):
+        return []
+    with open(HISTORY) as f:
+        return json.load(f)
+
+
+def compare(previous: dict, current: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in current["results"].items():
+        before = previous["results"].get(name)
+        if not before:
+            continue
+        if result["median_ms"] > before["median_ms"] * (1 + threshold):
+            regressions.append(f"{name}: {before['median_ms']}ms -> {result['median_ms']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=1, help="multiplies synthetic document sizes")
+    parser.add_argument("--models", choices=["auto", "real", "fake"], default="auto")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--no-history", action="store_true", help="do not append this run to history.json")
+    args = parser.parse_args()
+
+    env = fakes.install(models=args.models, llm_latency=args.llm_latency)
+    docs = synthetic.corpus(args.scale)
+
+    results = {}
+    results.update(bench_extraction(docs, args.repeat))
+    results.update(bench_chunking(docs, args.repeat))
+    results.update(bench_embedding(args.repeat))
+    results.update(bench_insert(docs, args.repeat))
+    results.update(asyncio.run(bench_routes(env, docs, args.repeat)))
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "config": {"models": env["models"], "scale": args.scale, "repeat": args.repeat, "llm_latency": args.llm_latency},
+        "results": results,
+    }
+    for name, result in results.items():
+        print(f"{name:28} {result['median_ms']:>10.2f} ms  {({k: v for k, v in result.items() if not k.endswith('_ms')})}")
+
+    history = load_history()
+    previous = next((r for r in reversed(history) if r["config"] == run["config"]), None)
+    regressions = compare(previous, run, args.threshold) if previous else []
+    if previous:
+        print(f"\nCompared with {previous['revision']} ({previous['timestamp']}):")
+        print("\n".join(f"  REGRESSION {r}" for r in regressions) or "  no regressions")
+
+    if not args.no_history:
+        history.append(run)
+        with open(HISTORY, "w") as f:
+            json.dump(history, f, indent=2)
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Synthetic documents for the benchmarks, generated in memory with a fixed seed."""
+import random
+from io import BytesIO
+from typing import List
+
+WORDS = ("vector index embedding latency throughput document page slide revenue "
+         "quarter growth customer churn network model quantization retrieval context "
+         "answer question upload conversation summary table figure appendix").split()
+
+MIME = {
+    "txt": "text/plain",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "png": "image/png",
+}
+
+
+def paragraphs(n: int, words: int = 80, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "." for _ in range(n)]
+
+
+def make_txt(pages: int = 20) -> bytes:
+    return "\n\n".join(paragraphs(pages * 4)).encode("utf-8")
+
+
+def make_pdf(pages: int = 20) -> bytes:
+    # A minimal hand written PDF with one Helvetica text stream per page
+    texts = paragraphs(pages * 4)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(pages):
+        lines = []
+        for para in texts[p * 4:(p + 1) * 4]:
+            words = para.split()
+            lines += [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        body = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+        content_ref = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_png(text: str = "Quarterly revenue grew 12 percent", size=(480, 120)) -> bytes:
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", size, "white")
+    ImageDraw.Draw(image).text((10, size[1] // 2 - 6), text, fill="black")
+    out = BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def make_docx(paragraph_count: int = 80, images: int = 2) -> bytes:
+    from docx import Document
+    document = Document()
+    for i, para in enumerate(paragraphs(paragraph_count)):
+        document.add_paragraph(para)
+        if images and i % max(1, paragraph_count // images) == 0:
+            document.add_picture(BytesIO(make_png(f"figure {i}")))
+    out = BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def make_pptx(slides: int = 20, images: int = 2) -> bytes:
+    from pptx import Presentation
+    from pptx.util import Inches
+    presentation = Presentation()
+    texts = paragraphs(slides * 2, words=40)
+    for i in range(slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {i + 1}"
+        slide.placeholders[1].text = "\n".join(texts[i * 2:i * 2 + 2])
+        if images and i % max(1, slides // images) == 0:
+            slide.shapes.add_picture(BytesIO(make_png(f"slide {i} chart")), Inches(1), Inches(5))
+    out = BytesIO()
+    presentation.save(out)
+    return out.getvalue()
+
+
+def corpus(scale: int = 1) -> dict:
+    return {
+        "txt": make_txt(20 * scale),
+        "pdf": make_pdf(20 * scale),
+        "docx": make_docx(80 * scale),
+        "pptx": make_pptx(20 * scale),
+        "png": make_png(),
+    }
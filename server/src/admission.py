@@ -0,0 +1,144 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from fastapi import HTTPException, Request
+from metrics import ADMISSION_QUEUED, ADMISSION_IN_FLIGHT, ADMISSION_REJECTED
+
+# Work is admitted in cost units: every operation must fit in both its
+# user's budget and the worker-wide budget. Waiting happens in short FIFO
+# queues; when a queue is full, or the wait would be too long, the request
+# is rejected with 429 and a Retry-After estimated from recent durations.
+COSTS = {"chat": 1, "file_chat": 1, "ingest": 4}
+GLOBAL_CAPACITY = int(os.getenv("ADMISSION_GLOBAL_CAPACITY", "24"))
+USER_CAPACITY = int(os.getenv("ADMISSION_USER_CAPACITY", "6"))
+GLOBAL_QUEUE = int(os.getenv("ADMISSION_GLOBAL_QUEUE", "32"))
+USER_QUEUE = int(os.getenv("ADMISSION_USER_QUEUE", "2"))
+MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class WeightedLimiter:
+    def __init__(self, scope: str, capacity: int, max_waiters: int):
+        self.scope = scope
+        self.capacity = capacity
+        self.max_waiters = max_waiters
+        self.used = 0
+        self.waiters = deque()
+
+    def idle(self) -> bool:
+        return self.used == 0 and not self.waiters
+
+    async def acquire(self, weight: int, timeout: float):
+        weight = min(weight, self.capacity)
+        if not self.waiters and self.used + weight <= self.capacity:
+            self._take(weight)
+            return
+        if len(self.waiters) >= self.max_waiters:
+            raise Rejected("queue_full")
+
+        waiter = (weight, asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        ADMISSION_QUEUED.labels(self.scope).inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), timeout)
+        except asyncio.TimeoutError:
+            if waiter[1].done():
+                # Granted just as the wait ran out, hand the units back
+                self.release(weight)
+            raise Rejected("timeout")
+        except asyncio.CancelledError:
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release(weight)
+            raise
+        finally:
+            ADMISSION_QUEUED.labels(self.scope).dec()
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                self._wake()
+
+    def release(self, weight: int):
+        weight = min(weight, self.capacity)
+        self.used -= weight
+        ADMISSION_IN_FLIGHT.labels(self.scope).dec(weight)
+        self._wake()
+
+    def _take(self, weight: int):
+        self.used += weight
+        ADMISSION_IN_FLIGHT.labels(self.scope).inc(weight)
+
+    def _wake(self):
+        # Strict FIFO: a heavy request at the head is not overtaken
+        while self.waiters and not self.waiters[0][1].done() and self.used + self.waiters[0][0] <= self.capacity:
+            weight, future = self.waiters.popleft()
+            self._take(weight)
+            future.set_result(True)
+        while self.waiters and self.waiters[0][1].done():
+            self.waiters.popleft()
+
+
+_global = WeightedLimiter("global", GLOBAL_CAPACITY, GLOBAL_QUEUE)
+_users: Dict[str, WeightedLimiter] = {}
+# Moving average of how long each operation holds its units, for Retry-After
+_durations = {op: 5.0 for op in COSTS}
+
+
+def _retry_after(operation: str) -> int:
+    return max(1, math.ceil(_durations[operation]))
+
+
+def client_key(request: Request, claims: Optional[dict], fallback: Optional[str] = None) -> str:
+    # Prefer the verified session, then what the request claims, then the address
+    if claims:
+        return f"user:{claims['sub']}"
+    if fallback:
+        return f"name:{fallback}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+@asynccontextmanager
+async def admit(key: str, operation: str):
+    weight = COSTS[operation]
+    user = _users.get(key)
+    if user is None:
+        user = _users[key] = WeightedLimiter("user", USER_CAPACITY, USER_QUEUE)
+
+    deadline = time.monotonic() + MAX_WAIT
+    acquired = []
+    try:
+        await user.acquire(weight, MAX_WAIT)
+        acquired.append(user)
+        await _global.acquire(weight, max(0.0, deadline - time.monotonic()))
+        acquired.append(_global)
+    except Rejected as e:
+        for limiter in acquired:
+            limiter.release(weight)
+        if user.idle():
+            _users.pop(key, None)
+        ADMISSION_REJECTED.labels(operation, e.reason).inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please retry shortly",
+            headers={"Retry-After": str(_retry_after(operation))}
+        )
+    except BaseException:
+        for limiter in acquired:
+            limiter.release(weight)
+        raise
+
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        _durations[operation] = 0.8 * _durations[operation] + 0.2 * (time.monotonic() - started)
+        _global.release(weight)
+        user.release(weight)
+        if user.idle():
+            _users.pop(key, None)
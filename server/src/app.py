@@ -1,7 +1,24 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import threading
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from routes.auth import router as auth_router
-from routes.llm import router as llm_router
+from routes.llm import router as llm_router, db
+from routes.debug import router as debug_router
+from routes.sessions import router as sessions_router
+from llm.index_pool import start_refiller
+from cleanup import start_sweeper
+from lazy import Lazy, warmup
+import metrics
+import profiling
+
+# Comma separated components to preload at startup, e.g. "embeddings,ocr,pinecone".
+# /ready answers 503 until all of them are loaded.
+WARMUP = [name.strip() for name in os.getenv("WARMUP", "").split(",") if name.strip()]
 
 app = FastAPI()
 
@@ -13,9 +30,59 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so path parameters don't explode the label set
+    route = request.scope.get("route")
+    metrics.observe("http", getattr(route, "path", "unmatched"), time.perf_counter() - started)
+    return response
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    if profiling.should_profile(request):
+        return await profiling.profile(request, call_next)
+    return await call_next(request)
+
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(llm_router, prefix="/llm", tags=["llm"])
+app.include_router(sessions_router, prefix="/llm", tags=["llm"])
+app.include_router(debug_router, prefix="/debug", tags=["debug"])
+
+@app.on_event("startup")
+async def startup():
+    # Keep a few vector indexes provisioned ahead of first uploads
+    start_refiller()
+    # Reclaim orphaned messages, conversation references and indexes
+    start_sweeper()
+    # Log a stack trace whenever something blocks the event loop
+    profiling.watchdog.start()
+    # Models load in the background so the worker starts serving right away
+    if WARMUP:
+        threading.Thread(target=warmup, args=(WARMUP,), name="warmup", daemon=True).start()
 
 @app.get("/")
 async def home():
     return {"msg": "this the root path for the server of docquer app"}
+
+@app.get("/ready")
+async def ready():
+    components = {name: lazy.describe() for name, lazy in Lazy.registry.items()}
+    try:
+        await asyncio.wait_for(run_in_threadpool(lambda: db.client.admin.command("ping")), timeout=2)
+        components["mongo"] = {"state": "ready"}
+    except Exception as e:
+        components["mongo"] = {"state": "failed", "error": str(e) or "timeout"}
+
+    is_ready = components["mongo"]["state"] == "ready" and all(
+        name in Lazy.registry and Lazy.registry[name].loaded() for name in WARMUP
+    )
+    return JSONResponse(
+        content={"ready": is_ready, "components": components},
+        status_code=200 if is_ready else 503
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.content_type)
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from db import MongoDB, lease
+from pineconedb import get_pc
+from llm import index_pool, chunk_store
+
+# Deleting a conversation removes the "convos" document and the user's
+# reference right away; its messages and vector index are removed afterwards
+# by cascade(). The sweeper reconciles whatever a failed or interrupted
+# cascade left behind, plus data that leaked before cascades existed.
+DELETE_BATCH = int(os.getenv("DELETE_BATCH", "1000"))
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", str(6 * 3600)))
+# Messages are written before the conversation points at them, and a new
+# conversation's user reference, index and chunks can appear after the sweep
+# listed the conversations, so only things older than this are considered
+# orphaned
+SWEEP_GRACE = float(os.getenv("SWEEP_GRACE", "3600"))
+INDEX_PREFIX = "docquer-"
+
+mongo = MongoDB()
+last_report: Optional[dict] = None
+_sweeper: Optional[threading.Thread] = None
+
+
+def _batches(ids: Iterable, size: int = DELETE_BATCH) -> Iterable[List]:
+    batch = []
+    for id in ids:
+        batch.append(id)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def delete_messages(ids: Iterable) -> int:
+    deleted = 0
+    for batch in _batches(ObjectId(id) if isinstance(id, str) else id for id in ids):
+        deleted += mongo.db["Message"].delete_many({"_id": {"$in": batch}}).deleted_count
+    return deleted
+
+
+def has_index(conv_id: str) -> bool:
+    name = index_pool.index_name(conv_id)
+    return index_pool.pool.count_documents({"name": name}) > 0 or name in get_pc().list_indexes().names()
+
+
+def cascade(conv_id: str, message_ids: List[str]):
+    """Removes what a deleted conversation owned. Safe to run more than once."""
+    started = time.time()
+    report = {"conv_id": conv_id, "messages": 0, "chunks": 0, "index": False}
+    try:
+        report["messages"] = delete_messages(message_ids)
+        report["chunks"] = chunk_store.delete_conv(conv_id)
+        mongo.db["users"].update_many({"convos": conv_id}, {"$pull": {"convos": conv_id}})
+        # Link-only conversations have an index but no fileName, so look
+        # the index up instead of trusting the conversation document
+        if has_index(conv_id):
+            index_pool.release(conv_id)
+            report["index"] = True
+    except Exception as e:
+        # Whatever is left is picked up by the next sweep
+        print(f"Error cleaning up conversation {conv_id}: {e}")
+    report["seconds"] = round(time.time() - started, 2)
+    print(f"Cleaned up conversation {conv_id}: {report}")
+
+
+def _recent(conv_id: str, cutoff: datetime) -> bool:
+    try:
+        return ObjectId(conv_id).generation_time > cutoff
+    except (InvalidId, TypeError):
+        return False
+
+
+def _deleted(conv_ids: Iterable[str], known: set, cutoff: datetime) -> List[str]:
+    # Ids missing from the snapshot taken when the sweep started are checked
+    # against "convos" again right before anything is deleted, and skipped
+    # while younger than SWEEP_GRACE
+    candidates = [id for id in set(conv_ids) - known if not _recent(id, cutoff)]
+    valid = [ObjectId(id) for id in candidates if ObjectId.is_valid(id)]
+    existing = set()
+    if valid:
+        existing = {str(doc["_id"]) for doc in mongo.db["convos"].find({"_id": {"$in": valid}}, {"_id": 1})}
+    return [id for id in candidates if id not in existing]
+
+
+def sweep() -> dict:
+    global last_report
+    started = time.time()
+    report = {"messages": 0, "user_refs": 0, "chunks": 0, "indexes": 0, "pooled_indexes": 0}
+    db = mongo.db
+
+    conv_ids = set()
+    referenced = set()
+    for conv in db["convos"].find({}, {"messages": 1}):
+        conv_ids.add(str(conv["_id"]))
+        referenced.update(conv.get("messages") or [])
+
+    # Messages no conversation points at
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=SWEEP_GRACE)
+    orphans = (
+        doc["_id"] for doc in db["Message"].find({"_id": {"$lt": ObjectId.from_datetime(cutoff)}}, {"_id": 1})
+        if str(doc["_id"]) not in referenced
+    )
+    report["messages"] = delete_messages(orphans)
+
+    # Chunk texts of deleted conversations
+    for conv_id in _deleted(chunk_store.conv_ids(), conv_ids, cutoff):
+        report["chunks"] += chunk_store.delete_conv(conv_id)
+
+    # Conversation ids users still list although the conversation is gone
+    for user in db["users"].find({"convos.0": {"$exists": True}}, {"convos": 1}):
+        dangling = _deleted(user["convos"], conv_ids, cutoff)
+        if dangling:
+            db["users"].update_one({"_id": user["_id"]}, {"$pull": {"convos": {"$in": dangling}}})
+            report["user_refs"] += len(dangling)
+
+    # Pooled indexes still claimed by a deleted conversation
+    claimed = [doc["conv_id"] for doc in index_pool.pool.find({"status": "claimed"}, {"conv_id": 1}) if doc.get("conv_id")]
+    for conv_id in _deleted(claimed, conv_ids, cutoff):
+        try:
+            index_pool.release(conv_id)
+            report["pooled_indexes"] += 1
+        except Exception as e:
+            print(f"Error releasing pooled index of {conv_id}: {e}")
+
+    # Per-conversation indexes created outside the pool
+    names = [
+        name for name in get_pc().list_indexes().names()
+        if name.startswith(INDEX_PREFIX) and not name.startswith(index_pool.POOL_PREFIX)
+    ]
+    for conv_id in _deleted([name[len(INDEX_PREFIX):] for name in names], conv_ids, cutoff):
+        name = f"{INDEX_PREFIX}{conv_id}"
+        try:
+            get_pc().delete_index(name)
+            report["indexes"] += 1
+        except Exception as e:
+            print(f"Error deleting orphaned index {name}: {e}")
+
+    report["seconds"] = round(time.time() - started, 2)
+    report["finishedAt"] = time.time()
+    last_report = report
+    print(f"Sweep reclaimed {report}")
+    return report
+
+
+def _sweep_loop():
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        try:
+            if lease(mongo.db, "sweeper", SWEEP_INTERVAL * 0.9):
+                sweep()
+        except Exception as e:
+            print(f"Error sweeping: {e}")
+
+
+def start_sweeper():
+    global _sweeper
+    if SWEEP_INTERVAL <= 0 or (_sweeper and _sweeper.is_alive()):
+        return
+    _sweeper = threading.Thread(target=_sweep_loop, name="sweeper", daemon=True)
+    _sweeper.start()
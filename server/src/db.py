@@ -1,13 +1,34 @@
 import os
+import socket
+import time
 from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 from fastapi.concurrency import run_in_threadpool
 from typing import List
 from bson import ObjectId
+from metrics import timed
 
 load_dotenv()
 
 MONGO_URL = os.getenv("DATABASE_URL")
+LEASE_HOLDER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease(db: Database, name: str, seconds: float) -> bool:
+    # With several workers only the one holding a job's lease runs it. The
+    # holder renews its own lease; others wait for it to expire.
+    now = time.time()
+    try:
+        db["Jobs"].update_one(
+            {"_id": name, "$or": [{"until": {"$lt": now}}, {"holder": LEASE_HOLDER}]},
+            {"$set": {"until": now + seconds, "holder": LEASE_HOLDER}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
 
 class MongoDB:
     def __init__(self, url=MONGO_URL):
@@ -19,33 +40,44 @@ class MongoDB:
 
     async def insert(self, name, data):
         collection = await self.get_collection(name)
-        result = await run_in_threadpool(lambda: collection.insert_one(data))
+        with timed("mongo", f"{name}:insert"):
+            result = await run_in_threadpool(lambda: collection.insert_one(data))
         return result.inserted_id
 
-    async def find(self, name, query={}):
+    async def insert_many(self, name, data: List[dict]):
+        collection = await self.get_collection(name)
+        with timed("mongo", f"{name}:insert_many"):
+            result = await run_in_threadpool(lambda: collection.insert_many(data, ordered=True))
+        return result.inserted_ids
+
+    async def find(self, name, query={}, projection=None):
         collection = await self.get_collection(name)
-        cursor = await run_in_threadpool(lambda: list(collection.find(query)))
+        with timed("mongo", f"{name}:find"):
+            cursor = await run_in_threadpool(lambda: list(collection.find(query, projection)))
         return cursor
     
-    async def find_by_ids(self, name, ids: List[str]):
+    async def find_by_ids(self, name, ids: List[str], projection=None):
         collection = await self.get_collection(name)
         object_ids = [ObjectId(id) for id in ids]
         query = {"_id": {"$in": object_ids}}
-        documents = await run_in_threadpool(lambda: list(collection.find(query)))
+        with timed("mongo", f"{name}:find"):
+            documents = await run_in_threadpool(lambda: list(collection.find(query, projection)))
         for doc in documents:
             doc["_id"] = str(doc["_id"])
         return documents
     
     async def update(self, name, query, update_data, many=False):
         collection = await self.get_collection(name)
-        if many:
-            result = await run_in_threadpool(lambda: collection.update_many(query, update_data))
-        else:
-            result = await run_in_threadpool(lambda: collection.update_one(query, update_data))
+        with timed("mongo", f"{name}:update"):
+            if many:
+                result = await run_in_threadpool(lambda: collection.update_many(query, update_data))
+            else:
+                result = await run_in_threadpool(lambda: collection.update_one(query, update_data))
         return result.modified_count
     
     async def remove(self, name, id: str):
         collection = await self.get_collection(name)
         object_id = ObjectId(id)
-        result = await run_in_threadpool(lambda: collection.delete_one({'_id': object_id}))
+        with timed("mongo", f"{name}:remove"):
+            result = await run_in_threadpool(lambda: collection.delete_one({'_id': object_id}))
         return result.deleted_count
\ No newline at end of file
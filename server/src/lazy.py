@@ -0,0 +1,65 @@
+import threading
+import time
+from typing import Callable, Dict, Generic, Iterable, TypeVar
+
+T = TypeVar("T")
+
+
+class Lazy(Generic[T]):
+    """
+    Builds an expensive value (a model, a client) on first use instead of at
+    import time. Every instance is registered by name so that /ready can
+    report its state and the startup warmup can preload it.
+    """
+
+    registry: Dict[str, "Lazy"] = {}
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self.factory = factory
+        self.value = None
+        self.state = "cold"  # cold -> loading -> ready | failed
+        self.error = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+        Lazy.registry[name] = self
+
+    def get(self) -> T:
+        if self.state == "ready":
+            return self.value
+        with self.lock:
+            if self.state != "ready":
+                self.state = "loading"
+                started = time.perf_counter()
+                try:
+                    self.value = self.factory()
+                except Exception as e:
+                    self.state, self.error = "failed", str(e)
+                    raise
+                self.load_seconds = round(time.perf_counter() - started, 3)
+                self.state, self.error = "ready", None
+        return self.value
+
+    def loaded(self) -> bool:
+        return self.state == "ready"
+
+    def describe(self) -> dict:
+        info = {"state": self.state}
+        if self.load_seconds is not None:
+            info["load_seconds"] = self.load_seconds
+        if self.error:
+            info["error"] = self.error
+        return info
+
+
+def warmup(names: Iterable[str]):
+    for name in names:
+        lazy = Lazy.registry.get(name)
+        if not lazy:
+            print(f"Unknown warmup component: {name}")
+            continue
+        try:
+            lazy.get()
+            print(f"Warmed up {name} in {lazy.load_seconds}s")
+        except Exception as e:
+            print(f"Error warming up {name}: {e}")
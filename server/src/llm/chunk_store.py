@@ -0,0 +1,85 @@
+import os
+import zlib
+from typing import Dict, Iterable, List, Tuple
+from bson.binary import Binary
+from db import MongoDB
+from metrics import timed
+
+# Chunk texts live in the "Chunk" collection, keyed by the id of their
+# vector, instead of in the vector metadata:
+#   {"_id": vector id, "conv_id": str, "z": zlib-compressed text} or
+#   {"_id": vector id, "conv_id": str, "t": text}   (short or uncompressed)
+# Vectors only carry provenance (source, page, page_end, ocr); the texts of
+# the chunks a query finally selects are fetched in one batch.
+CHUNK_COMPRESSION = os.getenv("CHUNK_COMPRESSION", "zlib")
+COMPRESS_MIN_CHARS = 200
+
+mongo = MongoDB()
+_indexed = False
+
+
+def _collection():
+    global _indexed
+    collection = mongo.db["Chunk"]
+    if not _indexed:
+        collection.create_index("conv_id")
+        _indexed = True
+    return collection
+
+
+def _encode(text: str) -> dict:
+    if CHUNK_COMPRESSION == "zlib" and len(text) >= COMPRESS_MIN_CHARS:
+        return {"z": Binary(zlib.compress(text.encode("utf-8"), 6))}
+    return {"t": text}
+
+
+def _decode(doc: dict) -> str:
+    if "z" in doc:
+        return zlib.decompress(doc["z"]).decode("utf-8")
+    return doc.get("t", "")
+
+
+def put_many(conv_id: str, chunks: Iterable[Tuple[str, str]]):
+    docs = [{"_id": id, "conv_id": conv_id, **_encode(text)} for id, text in chunks]
+    if docs:
+        with timed("mongo", "Chunk:insert_many"):
+            _collection().insert_many(docs, ordered=False)
+
+
+def get_many(ids: List[str]) -> Dict[str, str]:
+    if not ids:
+        return {}
+    with timed("mongo", "Chunk:find"):
+        return {doc["_id"]: _decode(doc) for doc in _collection().find({"_id": {"$in": list(ids)}})}
+
+
+def delete_conv(conv_id: str) -> int:
+    with timed("mongo", "Chunk:delete"):
+        return _collection().delete_many({"conv_id": conv_id}).deleted_count
+
+
+def delete_ids(ids: List[str]) -> int:
+    with timed("mongo", "Chunk:delete"):
+        return _collection().delete_many({"_id": {"$in": list(ids)}}).deleted_count
+
+
+def conv_ids() -> List[str]:
+    return _collection().distinct("conv_id")
+
+
+def with_texts(matches: List[dict]) -> List[dict]:
+    """
+    Fills metadata["text"] of query matches from the store. Vectors written
+    before the store existed still carry their text and are left as they are.
+    """
+    missing = [m["id"] for m in matches if not (m["metadata"] or {}).get("text")]
+    texts = get_many(missing)
+    filled = []
+    for match in matches:
+        metadata = dict(match["metadata"] or {})
+        if not metadata.get("text"):
+            if match["id"] not in texts:
+                continue
+            metadata["text"] = texts[match["id"]]
+        filled.append({"id": match["id"], "score": match["score"], "metadata": metadata})
+    return filled
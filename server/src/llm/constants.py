@@ -1,21 +1,15 @@
-from io import BytesIO
-from typing import List
-import uuid
-from pinecone import Index
-from pypdf import PdfReader
-from pptx import Presentation
-from docx import Document
-from PIL import Image
-import easyocr
-import numpy as np
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NotRequired, TypedDict
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 # from langchain_core.embeddings import FakeEmbeddings
 # from langchain.embeddings import HuggingFaceEmbeddings
-from sentence_transformers import SentenceTransformer
-from pineconedb import pc, spec
+from pineconedb import get_pc, get_spec, dimension
+from .index_pool import index_name, claim
+from .embeddings import MAX_SEQ_TOKENS, get_tokenizer
 from fastapi import HTTPException
 
-embeddings_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+if TYPE_CHECKING:
+    from pinecone import Index
 
 
 def normal_chat_main_content(name: str) -> str:
@@ -49,168 +43,119 @@ Your output should only include the corrected and enhanced Markdown content, wit
 """
 
 
-def getFileText(file: bytes, fileType: str) -> str:
-    match fileType:
-        case "text/plain":
-            return readTXT(file)
-        case "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            return readDOCX(file)
-        case "application/vnd.openxmlformats-officedocument.presentationml.presentation":
-            return readPPTX(file)
-        case "application/pdf":
-            return readPDF(file)
-        case "image/jpeg" | "image/png":
-            return readImage(file)
-        case _:
-            return "nothing matched"
-
-
-def readPDF(file: bytes) -> str:
-    try:
-        output = "This is a uploaded pdf file\n\n"
-        pdf_stream = BytesIO(file)
-        pdf_reader = PdfReader(pdf_stream)
-
-        for i, page in enumerate(pdf_reader.pages):
-            output += f"Page {i+1}:\n"
-            # Extract text content
-            page_text = page.extract_text()
-            if page_text.strip():
-                output += f"Uploaded PDF Content:\n{page_text}\n"
-
-            # Extract and process images
-            if '/XObject' in page['/Resources']:
-                xObject = page['/Resources']['/XObject'].get_object()
-                img_num = 1
-                
-                for obj in xObject:
-                    if xObject[obj]['/Subtype'] == '/Image':
-                        try:
-                            image_data = xObject[obj].get_object()
-                            # Convert image data to bytes
-                            if image_data['/Filter'] == '/DCTDecode':
-                                img_bytes = image_data._data
-                                text_from_image = readImage(img_bytes)
-                                if text_from_image and not text_from_image.isspace():
-                                    output += f"\nImage {img_num} Text:\n{text_from_image}\n"
-                                    img_num += 1
-                        except Exception as img_err:
-                            output += f"\nError processing image {img_num}: {str(img_err)}\n"
-                            img_num += 1
-            
-            output += '-'*40 + "\n"
-
-        return output
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing pdf file: {str(e)}")
-
-
-def readPPTX(file: bytes) -> str:
-    try:
-        pptx_stream = BytesIO(file)
-        presentation = Presentation(pptx_stream)
-        output = "This is a uploaded pptx file\n\n"
-        
-        for slide_num, slide in enumerate(presentation.slides, 1):
-            output += f"Slide {slide_num}:\n"
-            
-            # Extract text content
-            text_content = []
-            for shape in slide.shapes:
-                if shape.has_text_frame:
-                    for paragraph in shape.text_frame.paragraphs:
-                        if paragraph.text.strip():
-                            text_content.append(paragraph.text)
-            
-            if text_content:
-                output += "Uploaded PPTX Paragraph:\n" + "\n".join(text_content) + "\n"
-            
-            # Process images
-            img_num = 1
-            for shape in slide.shapes:
-                if hasattr(shape, "image"):
-                    try:
-                        # Get image bytes
-                        image_bytes = shape.image.blob
-                        text_from_image = readImage(image_bytes)
-                        if text_from_image and not text_from_image.isspace():
-                            output += f"\nImage {img_num} Text:\n{text_from_image}\n"
-                            img_num += 1
-                    except Exception as img_err:
-                        output += f"\nError processing image {img_num}: {str(img_err)}\n"
-                        img_num += 1
-            
-            output += '-'*40 + "\n"
-        
-        return output
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing pptx file: {str(e)}")
-
-
-def readTXT(file: bytes) -> str:
-    return "This is a uploaded text file\n\n"+file.decode('utf-8')
-
-
-def readDOCX(file: bytes) -> str:
-    try:
-        docx_stream = BytesIO(file)
-        document = Document(docx_stream)
-        output = "This is a uploaded docx file\n\n"
-        
-        # Track paragraph number for better organization
-        para_num = 1
-        img_num = 1
-        
-        # Iterate through the XML elements to preserve order
-        for element in document.element.body:
-            if element.tag.endswith("p"):  # Paragraph block (text)
-                text = ''.join(node.text for node in element.iter() if node.text).strip()
-                if text:
-                    output += f"Uploaded DOCX Paragraph {para_num}: {text}\n"
-                    para_num += 1
-                    
-            elif element.tag.endswith("drawing"):  # Image block
-                try:
-                    for rel in document.part.rels.values():
-                        if "image" in rel.target_ref:  # Check for image reference
-                            image_bytes = rel.target_part.blob
-                            text_from_image = readImage(image_bytes)
-                            if text_from_image and not text_from_image.isspace():
-                                output += f"\nImage {img_num} Text:\n{text_from_image}\n"
-                                img_num += 1
-                except Exception as img_err:
-                    output += f"\nError processing image {img_num}: {str(img_err)}\n"
-                    img_num += 1
-        
-        return output.strip()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing docx file: {str(e)}")
-
-
-def readImage(file):
-    image = Image.open(BytesIO(file))
-    reader = easyocr.Reader(['en'])
-    array = np.array(image)
-    res = reader.readtext(array)
-    text = "This is a uploaded image file\n\n" + "".join([r[1] for r in res])
-    return text
+# Chunks are sized in word-pieces of the embedding model so none of them is
+# truncated at MAX_SEQ_TOKENS. Tokenizing merged pieces can come out a few
+# tokens longer than the sum of the pieces, hence the headroom. Without the
+# tokenizer chunks fall back to 500 characters.
+CHUNK_TOKENS = MAX_SEQ_TOKENS - 16
+CHUNK_OVERLAP_TOKENS = 24
+
+_text_splitter = None
+_text_splitter_lock = threading.Lock()
+
+
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    global _text_splitter
+    if _text_splitter is None:
+        with _text_splitter_lock:
+            if _text_splitter is None:
+                tok = get_tokenizer()
+                if tok is not None:
+                    _text_splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+                        tok,
+                        chunk_size=CHUNK_TOKENS,
+                        chunk_overlap=CHUNK_OVERLAP_TOKENS,
+                    )
+                else:
+                    _text_splitter = RecursiveCharacterTextSplitter(
+                        chunk_size=500,
+                        chunk_overlap=50,
+                        length_function=len,
+                        is_separator_regex=False,
+                    )
+    return _text_splitter
+
+
+class ChunkRecord(TypedDict):
+    text: str
+    source: str
+    page: int
+    page_end: NotRequired[int]  # set when the chunk runs onto a later page
+    ocr: bool
 
 
 def split_into_chunks(data: str) -> List[str]:
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50,
-        length_function=len,
-        is_separator_regex=False,
-    )
-    texts = text_splitter.split_text(data)
-    return texts
-
-
-def get_index(conv_id: str) -> Index:
-    index_name = f"docquer-{conv_id}"
+    return get_text_splitter().split_text(data)
+
+
+def _offsets(buffer: str, pieces: List[str]) -> Iterator[int]:
+    # The splitter's own start_index can't be used: it searches from the end
+    # of the previous chunk minus chunk_overlap, which is counted in tokens,
+    # not characters. Chunks are substrings of the buffer in order, and each
+    # starts after the previous one's start, so a running cursor finds them.
+    cursor = 0
+    for piece in pieces:
+        start = buffer.find(piece, cursor)
+        if start < 0:
+            start = cursor
+        yield start
+        cursor = start + 1
+
+
+def stream_chunks(records: Iterable[dict]) -> Iterator[ChunkRecord]:
+    # Accepts extractor records (see extractors.DocRecord). The last chunk of
+    # every record is held back and re-split together with the next one, so
+    # chunks flow across page boundaries without materialising the whole
+    # document. Each chunk keeps the provenance of the record it starts in.
+    carry, carry_meta = "", None
+    for rec in records:
+        text = rec["text"].strip()
+        if not text:
+            continue
+        meta = {"source": rec["source"], "page": rec["page"], "ocr": rec["ocr"]}
+        if carry:
+            buffer = f"{carry}\n{text}"
+            boundary = len(carry) + 1
+        else:
+            buffer, boundary, carry_meta = text, 0, meta
+
+        pieces = get_text_splitter().split_text(buffer)
+        chunks = []
+        for piece, start in zip(pieces, _offsets(buffer, pieces)):
+            end = start + len(piece)
+            if start >= boundary:
+                chunk = {"text": piece, **meta}
+            else:
+                chunk = {"text": piece, **carry_meta}
+                if end > boundary:
+                    chunk["ocr"] = chunk["ocr"] or meta["ocr"]
+                    if meta["page"] != chunk["page"]:
+                        chunk["page_end"] = meta["page"]
+            chunks.append(chunk)
+
+        if not chunks:
+            continue
+        yield from chunks[:-1]
+        last = chunks[-1]
+        carry = last.pop("text")
+        carry_meta = last
+    if carry:
+        yield {"text": carry, **carry_meta}
+
+
+def cite(metadata: dict) -> str:
+    unit = {"pdf": "page", "pptx": "slide", "docx": "paragraph"}.get(metadata.get("source"))
+    if not unit:
+        return ""
+    pages = str(int(metadata["page"]))
+    if metadata.get("page_end"):
+        pages += f"-{int(metadata['page_end'])}"
+    return f"[{unit} {pages}] "
+
+
+def get_index(conv_id: str) -> "Index":
     try:
-        index = pc.Index(index_name)
+        index = get_pc().Index(index_name(conv_id))
         # Try to describe index to ensure it exists and is ready
         index.describe_index_stats()
         return index
@@ -219,73 +164,65 @@ def get_index(conv_id: str) -> Index:
         raise HTTPException(status_code=500, detail="Index not ready or doesn't exist")
 
 
-def insert_data(conv_id: str, data: List[str], replace: bool = False):
-    if not data:
-        return
-        
+# One lock per conversation so that two concurrent ingestions into the same
+# conversation don't both claim or create an index for it. Entries are
+# reference counted and dropped once nobody holds or waits for them.
+_init_locks: Dict[str, list] = {}
+_init_locks_guard = threading.Lock()
+
+
+def init_vector_db(conv_id: str) -> "Index":
+    with _init_locks_guard:
+        entry = _init_locks.setdefault(conv_id, [threading.Lock(), 0])
+        entry[1] += 1
     try:
-        index = get_index(conv_id)
-        
-        # If replace is True, delete existing vectors
-        if replace:
-            try:
-                index.delete(delete_all=True)
-            except Exception as e:
-                print(f"Error deleting vectors: {e}")
-                
-        embeddings = embeddings_model.encode(data)
-        vectors = [{
-            "id": str(uuid.uuid4()),
-            "values": embedding.tolist(),
-            "metadata": {"text": data[i]}
-        } for i, embedding in enumerate(embeddings)]
-        
-        # Split vectors into smaller batches
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
-            index.upsert(vectors=batch)
-            
-    except Exception as e:
-        print(f"Error inserting data: {e}")
-        raise HTTPException(status_code=500, detail=f"Error inserting data: {str(e)}")
+        with entry[0]:
+            return _init_vector_db(conv_id)
+    finally:
+        with _init_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _init_locks[conv_id]
 
 
-def init_vector_db(chunks: List[str], conv_id: str) -> Index:
-    if not chunks:
-        raise HTTPException(status_code=400, detail="No data to index")
+def _is_not_found(error: Exception) -> bool:
+    try:
+        from pinecone.exceptions import NotFoundException
+        if isinstance(error, NotFoundException):
+            return True
+    except ImportError:
+        pass
+    return getattr(error, "status", None) == 404
 
-    index_name = f"docquer-{conv_id}"
+
+def _init_vector_db(conv_id: str) -> "Index":
     try:
-        # Check if index exists and is ready
+        # Reuse the conversation's index if it already has one. Only a
+        # missing index falls through; a network or auth error must not cost
+        # the conversation its vectors.
         try:
-            index = pc.Index(index_name)
+            index = get_pc().Index(index_name(conv_id))
             index.describe_index_stats()
-        except:
-            # Create new index if it doesn't exist or isn't ready
-            if index_name in pc.list_indexes():
-                pc.delete_index(index_name)
-            pc.create_index(
-                name=index_name,
-                dimension=384,
-                metric='cosine',
-                spec=spec
-            )
-            # Wait for index to be ready
-            index = pc.Index(index_name)
-            retries = 0
-            while retries < 5:
-                try:
-                    index.describe_index_stats()
-                    break
-                except:
-                    retries += 1
-                    import time
-                    time.sleep(2)
-
-        # Insert data in batches
-        insert_data(conv_id, chunks)
-        return index
+            return index
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+
+        # Otherwise take a ready index from the pool
+        pooled = claim(conv_id)
+        if pooled:
+            return get_pc().Index(pooled)
+
+        # Pool is empty, fall back to provisioning one inline
+        print(f"Index pool empty, creating an index for {conv_id} inline")
+        name = f"docquer-{conv_id}"
+        get_pc().create_index(
+            name=name,
+            dimension=dimension,
+            metric='cosine',
+            spec=get_spec()
+        )
+        return get_pc().Index(name)
     except Exception as e:
         print(f"Error initializing vector DB: {e}")
         raise HTTPException(status_code=500, detail=f"Error initializing vector DB: {str(e)}")
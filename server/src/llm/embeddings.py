@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, List
+from lazy import Lazy
+from pineconedb import dimension
+from . import model_client
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+# Embedding backends, selected with EMBEDDING_BACKEND at startup:
+#   torch      - the reference PyTorch model
+#   onnx       - the same weights exported to ONNX and run by ONNX Runtime
+#   onnx-int8  - the int8 dynamically quantized ONNX export
+# All of them produce 384-dim vectors that are interchangeable with the
+# ones already stored in existing indexes.
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# The model repo ships quantized exports for avx512_vnni, avx512, avx2 and arm64
+ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+
+def load_embeddings_model(backend: str = EMBEDDING_BACKEND) -> "SentenceTransformer":
+    from sentence_transformers import SentenceTransformer
+    match backend:
+        case "torch":
+            model = SentenceTransformer(EMBEDDING_MODEL)
+        case "onnx":
+            model = SentenceTransformer(EMBEDDING_MODEL, backend="onnx")
+        case "onnx-int8":
+            model = SentenceTransformer(EMBEDDING_MODEL, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE})
+        case _:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+    if model.get_sentence_embedding_dimension() != dimension:
+        raise ValueError(f"Embedding backend '{backend}' produces {model.get_sentence_embedding_dimension()}-dim vectors, indexes expect {dimension}")
+    return model
+
+
+def _load():
+    if model_client.MODEL_SERVER_SOCKET:
+        return model_client.RemoteEmbeddings()
+    return load_embeddings_model()
+
+
+embeddings_model = Lazy("embeddings", _load)
+
+
+def get_embeddings_model() -> "SentenceTransformer":
+    return embeddings_model.get()
+
+
+# MiniLM silently truncates inputs past 256 word-pieces, [CLS] and [SEP]
+# included. Chunks are sized with the model's own tokenizer, which is small
+# and loaded even when the model itself runs behind the model server.
+MAX_SEQ_TOKENS = 256
+
+
+def _load_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+
+
+tokenizer = Lazy("tokenizer", _load_tokenizer)
+
+
+def get_tokenizer():
+    # None when the tokenizer can't be loaded (e.g. offline without a cached
+    # copy); callers then fall back to character lengths. Not retried.
+    if tokenizer.state == "failed":
+        return None
+    try:
+        return tokenizer.get()
+    except Exception as e:
+        print(f"Tokenizer unavailable, falling back to character lengths: {e}")
+        return None
+
+
+def token_lengths(texts: List[str]) -> List[int]:
+    tok = get_tokenizer()
+    if tok is None:
+        return [len(text) for text in texts]
+    ids = tok(texts, add_special_tokens=False, return_attention_mask=False)["input_ids"]
+    return [len(row) for row in ids]
+
+
+def encode_by_length(texts: List[str], batch_size: int = 64):
+    """
+    Encodes texts in batches of similar token length, so short chunks aren't
+    padded up to the longest one of a mixed batch. Rows come back in the
+    order of `texts`.
+    """
+    import numpy as np
+    if not texts:
+        return np.zeros((0, dimension), dtype=np.float32)
+    model = get_embeddings_model()
+    order = np.argsort(token_lengths(texts), kind="stable")
+    embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        embeddings[bucket] = np.asarray(model.encode([texts[i] for i in bucket], batch_size=batch_size))
+    return embeddings
+
+
+def parity(model: "SentenceTransformer", reference: "SentenceTransformer", sentences: List[str]) -> dict:
+    import numpy as np
+    # Cosine similarity between each backend vector and the reference vector
+    a = model.encode(sentences, normalize_embeddings=True)
+    b = reference.encode(sentences, normalize_embeddings=True)
+    sims = np.sum(a * b, axis=1)
+    return {"min_cosine": round(float(sims.min()), 5), "mean_cosine": round(float(sims.mean()), 5)}
+
+
+def throughput(model: "SentenceTransformer", sentences: List[str], batch_size: int = 64) -> float:
+    model.encode(sentences[:batch_size], batch_size=batch_size)  # warm up
+    started = time.perf_counter()
+    model.encode(sentences, batch_size=batch_size)
+    return round(len(sentences) / (time.perf_counter() - started), 1)
+
+
+def sample_sentences(n: int = 512) -> List[str]:
+    import numpy as np
+    words = ("the index stores vectors for every uploaded document page and slide so that "
+             "questions about quarterly revenue growth network latency model quantization "
+             "and customer churn can be answered with citations").split()
+    rng = np.random.default_rng(0)
+    return [" ".join(rng.choice(words, size=rng.integers(8, 120))) for _ in range(n)]
+
+
+def compare_backends(backends: List[str] = BACKENDS, n: int = 512) -> dict:
+    sentences = sample_sentences(n)
+    reference = load_embeddings_model("torch")
+    results = {}
+    for backend in backends:
+        try:
+            model = reference if backend == "torch" else load_embeddings_model(backend)
+        except Exception as e:
+            results[backend] = {"error": str(e)}
+            continue
+        results[backend] = {
+            **parity(model, reference, sentences[:64]),
+            "sentences_per_second": throughput(model, sentences),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    # python -m llm.embeddings [backend ...]  (run from src/)
+    for backend, result in compare_backends(sys.argv[1:] or BACKENDS).items():
+        print(f"{backend:10} {result}")
@@ -0,0 +1,214 @@
+from io import BytesIO
+from typing import Iterator, Optional, Set, TypedDict
+from fastapi import HTTPException
+from lazy import Lazy
+from metrics import timed, timed_iter, cache_result
+from . import model_client, ocr_cache
+
+# Parser and OCR libraries are imported inside the readers so that importing
+# this module stays cheap; the easyocr model is loaded once, on first use.
+def _load_ocr():
+    import easyocr
+    return easyocr.Reader(['en'])
+
+
+ocr_reader = Lazy("ocr", _load_ocr)
+
+
+class DocRecord(TypedDict):
+    source: str  # "pdf", "pptx", "docx", "txt", "image", "web" or "youtube"
+    page: int    # 1-based page, slide or paragraph number depending on source
+    text: str
+    ocr: bool    # text was recognised from an embedded image
+
+
+def record(source: str, page: int, text: str, ocr: bool = False) -> DocRecord:
+    return {"source": source, "page": page, "text": text, "ocr": ocr}
+
+
+FILE_KINDS = {
+    "text/plain": "txt",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": "pptx",
+    "application/pdf": "pdf",
+    "image/jpeg": "image",
+    "image/png": "image",
+}
+
+
+def extract(file: bytes, fileType: str) -> Iterator[DocRecord]:
+    # OCR time of embedded images is part of the extraction time as well
+    return timed_iter(_extract(file, fileType), "extract", FILE_KINDS.get(fileType, "other"))
+
+
+def _extract(file: bytes, fileType: str) -> Iterator[DocRecord]:
+    match fileType:
+        case "text/plain":
+            yield from readTXT(file)
+        case "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+            yield from readDOCX(file)
+        case "application/vnd.openxmlformats-officedocument.presentationml.presentation":
+            yield from readPPTX(file)
+        case "application/pdf":
+            yield from readPDF(file)
+        case "image/jpeg" | "image/png":
+            text = readImage(file)
+            if text.strip():
+                yield record("image", 1, text, ocr=True)
+        case _:
+            print(f"Unsupported file type: {fileType}")
+
+
+class DocumentImages:
+    """
+    OCR for the embedded images of one document. Each distinct image is read
+    once; repeats (logos, slide templates) yield no text the second time so
+    they don't produce duplicate chunks.
+    """
+
+    def __init__(self):
+        self.seen: Set[str] = set()
+
+    def read(self, image: bytes) -> str:
+        key = ocr_cache.image_key(image)
+        if key in self.seen:
+            return ""
+        self.seen.add(key)
+        return readImage(image, key)
+
+
+def getFileText(file: bytes, fileType: str) -> str:
+    return "\n".join(r["text"] for r in extract(file, fileType))
+
+
+def readPDF(file: bytes) -> Iterator[DocRecord]:
+    from pypdf import PdfReader
+    try:
+        pdf_stream = BytesIO(file)
+        pdf_reader = PdfReader(pdf_stream)
+        images = DocumentImages()
+
+        for page_num, page in enumerate(pdf_reader.pages, 1):
+            # Extract text content
+            page_text = page.extract_text()
+            if page_text.strip():
+                yield record("pdf", page_num, page_text)
+
+            # Extract and process images
+            if '/XObject' in page['/Resources']:
+                xObject = page['/Resources']['/XObject'].get_object()
+
+                for obj in xObject:
+                    if xObject[obj]['/Subtype'] == '/Image':
+                        try:
+                            image_data = xObject[obj].get_object()
+                            # Convert image data to bytes
+                            if image_data['/Filter'] == '/DCTDecode':
+                                text_from_image = images.read(image_data._data)
+                                if text_from_image.strip():
+                                    yield record("pdf", page_num, text_from_image, ocr=True)
+                        except Exception as img_err:
+                            print(f"Error processing image on pdf page {page_num}: {img_err}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing pdf file: {str(e)}")
+
+
+def readPPTX(file: bytes) -> Iterator[DocRecord]:
+    from pptx import Presentation
+    try:
+        pptx_stream = BytesIO(file)
+        presentation = Presentation(pptx_stream)
+        images = DocumentImages()
+
+        for slide_num, slide in enumerate(presentation.slides, 1):
+            # Extract text content
+            text_content = []
+            for shape in slide.shapes:
+                if shape.has_text_frame:
+                    for paragraph in shape.text_frame.paragraphs:
+                        if paragraph.text.strip():
+                            text_content.append(paragraph.text)
+
+            if text_content:
+                yield record("pptx", slide_num, "\n".join(text_content))
+
+            # Process images
+            for shape in slide.shapes:
+                if hasattr(shape, "image"):
+                    try:
+                        text_from_image = images.read(shape.image.blob)
+                        if text_from_image.strip():
+                            yield record("pptx", slide_num, text_from_image, ocr=True)
+                    except Exception as img_err:
+                        print(f"Error processing image on slide {slide_num}: {img_err}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing pptx file: {str(e)}")
+
+
+def readTXT(file: bytes) -> Iterator[DocRecord]:
+    yield record("txt", 1, file.decode('utf-8'))
+
+
+BLIP = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+EMBED = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed"
+
+
+def readDOCX(file: bytes) -> Iterator[DocRecord]:
+    from docx import Document
+    try:
+        docx_stream = BytesIO(file)
+        document = Document(docx_stream)
+        images = DocumentImages()
+
+        # Track paragraph number for better organization
+        para_num = 0
+
+        # Iterate through the XML elements to preserve order
+        for element in document.element.body:
+            if element.tag.endswith("}p"):  # Paragraph block (text)
+                para_num += 1
+                text = ''.join(node.text for node in element.iter() if node.text).strip()
+                if text:
+                    yield record("docx", para_num, text)
+
+            # Images sit in drawings inside the block; each drawing points at
+            # exactly one image part through the r:embed of its blip
+            for blip in element.iter(BLIP):
+                try:
+                    part = document.part.related_parts.get(blip.get(EMBED))
+                    if part is None:
+                        continue
+                    text_from_image = images.read(part.blob)
+                    if text_from_image.strip():
+                        yield record("docx", para_num, text_from_image, ocr=True)
+                except Exception as img_err:
+                    print(f"Error processing image after paragraph {para_num}: {img_err}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing docx file: {str(e)}")
+
+
+def readImage(file: bytes, key: Optional[str] = None) -> str:
+    key = key or ocr_cache.image_key(file)
+    cached = ocr_cache.get(key)
+    cache_result("ocr", cached is not None)
+    if cached is not None:
+        return cached
+    if not ocr_cache.worth_reading(file):
+        text = ""
+    else:
+        with timed("ocr"):
+            if model_client.MODEL_SERVER_SOCKET:
+                text = model_client.ocr(file)
+            else:
+                text = recognize(file)
+    ocr_cache.put(key, text)
+    return text
+
+
+def recognize(file: bytes) -> str:
+    from PIL import Image
+    import numpy as np
+    image = Image.open(BytesIO(file))
+    array = np.array(image)
+    res = ocr_reader.get().readtext(array)
+    return " ".join([r[1] for r in res])
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from db import MongoDB, lease
+from pineconedb import get_pc, get_spec, dimension
+
+# Serverless indexes take a while to provision, so a few empty ones are
+# created ahead of time and handed out to conversations on their first
+# upload. Pool state lives in the "IndexPool" collection so that every
+# worker shares it:
+#   {"name": str, "status": "provisioning" | "ready" | "claimed", "conv_id": str | None,
+#    "claim": str}   (the conv_id again, only while claimed)
+# A unique sparse index on "claim" allows one claimed index per conversation
+# across workers, and a lease lets only one worker create pooled indexes.
+POOL_SIZE = int(os.getenv("INDEX_POOL_SIZE", "2"))
+REFILL_INTERVAL = float(os.getenv("INDEX_POOL_REFILL_INTERVAL", "30"))
+POOL_PREFIX = "docquer-pool-"
+# A conversation keeps its claimed index until it is deleted, so the name is
+# cached; the TTL bounds how long a worker can miss a release on another one
+NAME_CACHE_TTL = float(os.getenv("INDEX_NAME_CACHE_TTL", "60"))
+NAME_CACHE_SIZE = 10000
+
+mongo = MongoDB()
+pool = mongo.db["IndexPool"]
+
+_indexed = False
+_names: dict = {}
+_refill_wanted = threading.Event()
+_refiller: Optional[threading.Thread] = None
+
+
+def _ensure_indexes():
+    global _indexed
+    if not _indexed:
+        pool.create_index("claim", unique=True, sparse=True, name="one_claim_per_conv")
+        pool.create_index("conv_id")
+        _indexed = True
+
+
+def _remember(conv_id: str, name: str):
+    if len(_names) >= NAME_CACHE_SIZE:
+        _names.clear()
+    _names[conv_id] = (name, time.monotonic() + NAME_CACHE_TTL)
+
+
+def index_name(conv_id: str) -> str:
+    # Only claimed names are cached. The docquer-{id} fallback isn't: another
+    # worker may claim a pooled index for the conversation at any moment.
+    cached = _names.get(conv_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    _ensure_indexes()
+    claimed = pool.find_one({"conv_id": conv_id, "status": "claimed"}, {"name": 1})
+    if not claimed:
+        # Conversations indexed before the pool existed keep their own index
+        return f"docquer-{conv_id}"
+    _remember(conv_id, claimed["name"])
+    return claimed["name"]
+
+
+def claim(conv_id: str) -> Optional[str]:
+    _ensure_indexes()
+    try:
+        doc = pool.find_one_and_update(
+            {"status": "ready"},
+            {"$set": {"status": "claimed", "conv_id": conv_id, "claim": conv_id, "claimedAt": time.time()}},
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another worker claimed one for this conversation first; the ready
+        # index stays in the pool
+        doc = pool.find_one({"conv_id": conv_id, "status": "claimed"}, {"name": 1})
+    _refill_wanted.set()
+    if not doc:
+        return None
+    _remember(conv_id, doc["name"])
+    return doc["name"]
+
+
+def release(conv_id: str):
+    # Recycle the conversation's index into the pool while it is short,
+    # otherwise delete it
+    name = index_name(conv_id)
+    _names.pop(conv_id, None)
+    doc = pool.find_one({"name": name})
+    if doc and pool.count_documents({"status": {"$in": ["ready", "provisioning"]}}) < POOL_SIZE:
+        get_pc().Index(name).delete(delete_all=True)
+        pool.update_one({"_id": doc["_id"]}, {"$set": {"status": "ready", "conv_id": None}, "$unset": {"claim": ""}})
+        return
+    get_pc().delete_index(name)
+    if doc:
+        pool.delete_one({"_id": doc["_id"]})
+
+
+def refill():
+    waiting = list(pool.find({"status": "provisioning"}))
+    for doc in waiting:
+        try:
+            if get_pc().describe_index(doc["name"]).status["ready"]:
+                pool.update_one({"_id": doc["_id"]}, {"$set": {"status": "ready"}})
+        except Exception as e:
+            print(f"Error checking pooled index {doc['name']}: {e}")
+
+    missing = POOL_SIZE - pool.count_documents({"status": {"$in": ["ready", "provisioning"]}})
+    for _ in range(missing):
+        name = f"{POOL_PREFIX}{uuid.uuid4().hex[:12]}"
+        try:
+            get_pc().create_index(name=name, dimension=dimension, metric='cosine', spec=get_spec(), timeout=-1)
+            pool.insert_one({"name": name, "status": "provisioning", "conv_id": None})
+        except Exception as e:
+            print(f"Error creating pooled index {name}: {e}")
+            break
+    return missing > 0 or len(waiting) > 0
+
+
+def _refill_loop():
+    while True:
+        try:
+            # Every worker runs this loop, but only the lease holder creates
+            # indexes, otherwise each would top the pool up on its own
+            busy = refill() if lease(mongo.db, "index-pool-refill", REFILL_INTERVAL * 2) else False
+        except Exception as e:
+            print(f"Error refilling index pool: {e}")
+            busy = False
+        # Poll quickly while indexes are provisioning, otherwise sleep until
+        # an index is claimed or the interval passes
+        _refill_wanted.wait(timeout=2 if busy else REFILL_INTERVAL)
+        _refill_wanted.clear()
+
+
+def start_refiller():
+    global _refiller
+    if POOL_SIZE <= 0 or (_refiller and _refiller.is_alive()):
+        return
+    _refiller = threading.Thread(target=_refill_loop, name="index-pool-refill", daemon=True)
+    _refiller.start()
@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, TypedDict
+import numpy as np
+from pymongo.database import Database
+from metrics import timed
+from pineconedb import dimension
+from .embeddings import get_embeddings_model
+from .pipeline import stored_vectors
+from . import chunk_store
+
+# One in-memory HNSW index per user over the chunks of all their
+# conversations. Each conversation's vectors are copied from its own index
+# once; afterwards a search only compares every conversation's
+# "indexVersion" (bumped on each upload, replacement or link) with the
+# version that was loaded, and re-syncs just the conversations that changed,
+# appeared or disappeared. Libraries not searched for a while are dropped
+# once more than LIBRARY_MAX_USERS are loaded.
+LIBRARY_MAX_USERS = int(os.getenv("LIBRARY_MAX_USERS", "32"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+INITIAL_CAPACITY = 1024
+
+
+class LibraryHit(TypedDict):
+    conv_id: str
+    title: str
+    fileName: Optional[str]
+    text: str
+    source: str
+    page: int
+    page_end: Optional[int]
+    score: float
+
+
+class UserLibrary:
+    def __init__(self):
+        import hnswlib
+        self.index = hnswlib.Index(space="cosine", dim=dimension)
+        self.index.init_index(
+            max_elements=INITIAL_CAPACITY, M=HNSW_M,
+            ef_construction=HNSW_EF_CONSTRUCTION, allow_replace_deleted=True
+        )
+        self.index.set_ef(HNSW_EF_SEARCH)
+        self.chunks: Dict[int, dict] = {}
+        self.labels: Dict[str, List[int]] = {}
+        self.versions: Dict[str, int] = {}
+        self.next_label = 0
+        self.lock = threading.Lock()
+
+    def remove(self, conv_id: str):
+        for label in self.labels.pop(conv_id, []):
+            self.index.mark_deleted(label)
+            del self.chunks[label]
+        self.versions.pop(conv_id, None)
+
+    def add(self, conv_id: str, version: int):
+        self.remove(conv_id)
+        labels, vectors = [], []
+        for id, values, metadata in stored_vectors(conv_id):
+            label = self.next_label
+            self.next_label += 1
+            # Only provenance is kept in memory, texts are fetched for hits
+            metadata.pop("text", None)
+            self.chunks[label] = {"id": id, "conv_id": conv_id, **metadata}
+            labels.append(label)
+            vectors.append(values)
+        if vectors:
+            # Deleted slots are reused first, so only live chunks need room
+            needed = len(self.chunks)
+            if needed > self.index.get_max_elements():
+                self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+            self.index.add_items(np.asarray(vectors, dtype=np.float32), labels, replace_deleted=True)
+        self.labels[conv_id] = labels
+        self.versions[conv_id] = version
+
+    def sync(self, convs: Dict[str, int]):
+        for conv_id in set(self.versions) - set(convs):
+            self.remove(conv_id)
+        for conv_id, version in convs.items():
+            if self.versions.get(conv_id) != version:
+                try:
+                    self.add(conv_id, version)
+                except Exception as e:
+                    # Conversations whose index is missing are retried next time
+                    print(f"Error loading {conv_id} into the library: {e}")
+                    self.remove(conv_id)
+
+    def search(self, vector: np.ndarray, k: int) -> List[tuple]:
+        count = len(self.chunks)
+        if count == 0:
+            return []
+        k = min(k, count)
+        self.index.set_ef(max(HNSW_EF_SEARCH, k))
+        labels, distances = self.index.knn_query(vector.reshape(1, -1), k=k)
+        return [(self.chunks[int(label)], 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+
+
+_libraries: "OrderedDict[str, UserLibrary]" = OrderedDict()
+_libraries_lock = threading.Lock()
+
+
+def _library(username: str) -> UserLibrary:
+    with _libraries_lock:
+        library = _libraries.get(username)
+        if library is None:
+            library = _libraries[username] = UserLibrary()
+        _libraries.move_to_end(username)
+        while len(_libraries) > LIBRARY_MAX_USERS:
+            _libraries.popitem(last=False)
+        return library
+
+
+def search_library(db: Database, username: str, query: str, k: int = 10) -> List[LibraryHit]:
+    with timed("mongo", "convos:find"):
+        convs = {
+            str(conv["_id"]): conv for conv in db["convos"].find(
+                {"username": username, "$or": [{"fileName": {"$ne": None}}, {"links.0": {"$exists": True}}]},
+                {"title": 1, "fileName": 1, "indexVersion": 1}
+            )
+        }
+    library = _library(username)
+    with library.lock:
+        with timed("library", "sync"):
+            library.sync({conv_id: conv.get("indexVersion", 0) for conv_id, conv in convs.items()})
+        with timed("embed", "query"):
+            vector = np.asarray(get_embeddings_model().encode(query), dtype=np.float32)
+        with timed("library", "search"):
+            matches = library.search(vector, k)
+
+    texts = chunk_store.get_many([chunk["id"] for chunk, _ in matches])
+    hits = []
+    for chunk, score in matches:
+        if chunk["id"] not in texts:
+            texts.update(_legacy_text(chunk))
+        conv = convs.get(chunk["conv_id"], {})
+        hits.append({
+            "conv_id": chunk["conv_id"],
+            "title": conv.get("title", ""),
+            "fileName": conv.get("fileName"),
+            "text": texts.get(chunk["id"], ""),
+            "source": chunk.get("source", ""),
+            "page": chunk.get("page", 1),
+            "page_end": chunk.get("page_end"),
+            "score": round(score, 4),
+        })
+    return hits
+
+
+def _legacy_text(chunk: dict) -> dict:
+    # Vectors written before the chunk store still carry their text
+    from .constants import get_index
+    fetched = get_index(chunk["conv_id"]).fetch(ids=[chunk["id"]])
+    vector = fetched.vectors.get(chunk["id"])
+    if vector and vector.metadata and vector.metadata.get("text"):
+        return {chunk["id"]: vector.metadata["text"]}
+    return {}
@@ -1,10 +1,12 @@
 from langchain_groq import ChatGroq
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from .constants import normal_chat_main_content, normal_chat_editor, getFileText, split_into_chunks, init_vector_db, get_index, insert_data
-from typing import TypedDict, List
-from sentence_transformers import SentenceTransformer
+from .constants import normal_chat_main_content, normal_chat_editor, stream_chunks, cite, init_vector_db, get_index
+from .embeddings import get_embeddings_model
+from .extractors import extract, record
+from .pipeline import insert_data
+from . import chunk_store
+from typing import Iterator, TypedDict, List
 from fastapi import HTTPException
-from pineconedb import pc, spec
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, parse_qs
@@ -12,6 +14,13 @@ from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api.formatters import TextFormatter
 from youtube_transcript_api._errors import NoTranscriptFound, TranscriptsDisabled
 from typing import Optional
+from metrics import timed, timed_iter, record_tokens
+
+def invoke(model: ChatGroq, messages, call: str):
+    with timed("llm", call):
+        msg = model.invoke(messages)
+    record_tokens(call, msg)
+    return msg
 
 class MessageDict(TypedDict):
     _id: str
@@ -37,14 +46,14 @@ def normal_chat(name: str, api_key: str, query: str, prevMessages: List[MessageD
     messages = [SystemMessage(content=content), HumanMessage(content=query)]
     history.insert(0, messages[0])
     history.append(messages[1])
-    msg = model.invoke(history)
+    msg = invoke(model, history, "chat")
 
     query2 = f"troubleshoot this {msg.content}"
 
     messages = [SystemMessage(content=content2), HumanMessage(content=query2)]
-    msg = model.invoke(messages)
+    msg = invoke(model, messages, "editor")
 
-    final_msg = model.invoke(messages)
+    final_msg = invoke(model, messages, "editor")
 
     return {'message': final_msg}
 
@@ -54,7 +63,7 @@ def title_recommender(key: str, query: str):
     content = "You are name recommender based on the question asked and the name should be around two words, less than 18 characters and return just the name nothing less nothing more"
 
     messages = [SystemMessage(content=content), HumanMessage(content=query)]
-    msg = model.invoke(messages)
+    msg = invoke(model, messages, "title")
     
     return msg.content
 
@@ -63,77 +72,58 @@ def subtitle_recommender(key: str, title: str, query: str):
     content = f"You are subtitle recommender based on the {title} and {query} asked and the name should be around 4 to 5 words, less than 36 characters and return just the name nothing less nothing more"
 
     messages = [SystemMessage(content=content), HumanMessage(content=query)]
-    msg = model.invoke(messages)
+    msg = invoke(model, messages, "subtitle")
     
     return msg.content
 
 def create_index(file: bytes, fileType: str, conv_id: str):
-    file_string = getFileText(file, fileType)
-    chunks = split_into_chunks(file_string)
-    init_vector_db(chunks, conv_id)
+    init_vector_db(conv_id)
+    if insert_data(conv_id, stream_chunks(extract(file, fileType))) == 0:
+        raise HTTPException(status_code=400, detail="No data to index")
 
-def delete_index(conv_id: str):
-    index_name = f"docquer-{conv_id}"
-    try:
-        pc.delete_index(index_name)
-    except Exception as e:
-        print("Error deleting index: ", e)
-        raise HTTPException(status_code=500, detail="Error deleting existing index")
-        
 def replace_index(file: bytes, fileType: str, conv_id: str):
-    index_name = f"docquer-{conv_id}"
-    if index_name in pc.list_indexes():
-        try:
-            pc.delete_index(index_name)
-        except Exception as e:
-            print("Error deleting index: ", e)
-            raise HTTPException(status_code=500, detail="Error deleting existing index")
-    file_string = getFileText(file, fileType)
-    chunks = split_into_chunks(file_string)
-    init_vector_db(chunks, conv_id)
+    # The conversation keeps its index, only the vectors are replaced
+    init_vector_db(conv_id)
+    if insert_data(conv_id, stream_chunks(extract(file, fileType)), replace=True) == 0:
+        raise HTTPException(status_code=400, detail="No data to index")
 
-def update_index(file: Optional[bytes], fileType: Optional[str], text: Optional[str], conv_id: str):
+def update_index(file: Optional[bytes], fileType: Optional[str], text: Optional[str], conv_id: str, source: str = "web"):
     if not file and not text:
         raise HTTPException(status_code=400, detail="Please provide either file or text")
-    
-    index_name = f"docquer-{conv_id}"
+
+    if file:
+        chunks = stream_chunks(extract(file, fileType))
+    else:
+        chunks = stream_chunks([record(source, 1, text)])
+
     try:
-        chunks = []
-        if file:
-            file_string = getFileText(file, fileType)
-            chunks = split_into_chunks(file_string)
-        elif text:
-            chunks = split_into_chunks(text)
-
-        # Try to get existing index first
-        try:
-            index = pc.Index(index_name)
-            # Check if index is actually ready
-            index.describe_index_stats()
-            # If we get here, index exists and is ready - append data
-            insert_data(conv_id, chunks, replace=False)
-        except Exception as e:
-            if "not found" in str(e) or "does not exist" in str(e):
-                # Index truly doesn't exist, create it
-                pc.create_index(index_name, dimension=384, metric='cosine', spec=spec)
-                insert_data(conv_id, chunks, replace=True)
-            else:
-                # Some other error occurred
-                raise e
-            
+        init_vector_db(conv_id)
+        insert_data(conv_id, chunks, replace=False)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in update_index: {e}")
-        if "not found" in str(e):
-            raise HTTPException(status_code=404, detail="Index not found")
-        if "already exists" in str(e):
-            # If index already exists but we couldn't access it earlier,
-            # it might have been in the process of being created
-            try:
-                insert_data(conv_id, chunks, replace=False)
-            except Exception as inner_e:
-                raise HTTPException(status_code=500, detail=f"Error updating index: {str(inner_e)}")
-        else:
-            raise HTTPException(status_code=500, detail=f"Error updating index: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error updating index: {str(e)}")
+
+def document_prompt(index, query: str) -> Optional[str]:
+    # The question wrapped in the best matching chunks, or None without matches
+    with timed("embed", "query"):
+        query_embed = get_embeddings_model().encode(query)
+    with timed("vector_query"):
+        context = index.query(
+            vector=query_embed.tolist(),
+            top_k=5,
+            include_metadata=True
+        )
+    matches = chunk_store.with_texts(context["matches"])
+    if len(matches) == 0:
+        print(context)
+        return None
+
+    prompt = "According to the uploaded document the context: '"
+    for match in matches:
+        prompt += cite(match["metadata"]) + match["metadata"]["text"] + "\n"
+    return f"{prompt}\n\n give the detailed response for the '{query}' and eloborate clearly the topic according to the context if needed without hallucinating"
 
 def file_chat(api_key: str, username, query: str, conv_id: str, prevMessages):
     index = get_index(conv_id)
@@ -144,21 +134,9 @@ def file_chat(api_key: str, username, query: str, conv_id: str, prevMessages):
         )
     except:
         return {"error": "Something went wrong check your api key"}
-    embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    query_embed = embedding_model.encode(query)
-    context = index.query(
-        vector=query_embed.tolist(),
-        top_k=5,
-        include_metadata=True
-    )
-
-    if len(context["matches"]) > 0:
-        prompt = "According to the uploaded document the context: '"
-        for match in context["matches"]:
-            prompt += match["metadata"]["text"]
-
-        human_query = f"{prompt}\n\n give the detailed response for the '{query}' and eloborate clearly the topic according to the context if needed without hallucinating"
-        
+
+    human_query = document_prompt(index, query)
+    if human_query:
         context1 = normal_chat_main_content(username)
         history = []
         for d in prevMessages:
@@ -170,18 +148,32 @@ def file_chat(api_key: str, username, query: str, conv_id: str, prevMessages):
         messages = [SystemMessage(content=context1), HumanMessage(content=human_query)]
         history.insert(0, messages[0])
         history.append(messages[1])
-        msg = model.invoke(history)
+        msg = invoke(model, history, "file_chat")
 
         query2 = f"troubleshoot this {msg.content}"
 
         context2 = normal_chat_editor()
         messages = [SystemMessage(content=context2), HumanMessage(content=query2)]
-        response = model.invoke(messages)
+        response = invoke(model, messages, "editor")
 
         return {'message': response}
-    print(context)
     return {'error': "No relevant context found to answer the query."}
 
+def chat_model(api_key: str) -> ChatGroq:
+    return ChatGroq(model="llama3-70b-8192", api_key=api_key, temperature=0.5)
+
+def stream_reply(model: ChatGroq, messages, call: str) -> Iterator[str]:
+    """
+    Same two passes as normal_chat and file_chat, except that the editor pass,
+    which produces the answer the user sees, is streamed.
+    """
+    msg = invoke(model, messages, call)
+    editor = [SystemMessage(content=normal_chat_editor()), HumanMessage(content=f"troubleshoot this {msg.content}")]
+    for chunk in timed_iter(model.stream(editor), "llm", "editor"):
+        record_tokens("editor", chunk)
+        if chunk.content:
+            yield chunk.content
+
 def get_link_data(url: str, conv_id: str):
     try:
         # Validate URL
@@ -213,9 +205,6 @@ def get_link_data(url: str, conv_id: str):
         
         # Get text and clean it
         text = soup.get_text(separator='\n', strip=True)
-        chunks = split_into_chunks(text)
-
-        print(f"Number of chunks: {len(chunks)}")
 
         update_index(file=None, fileType=None, text=text, conv_id=conv_id)
         
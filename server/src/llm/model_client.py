@@ -0,0 +1,79 @@
+import os
+import threading
+from multiprocessing.connection import Client
+from typing import List, Tuple, Union
+import numpy as np
+import orjson
+
+# When set, embedding and OCR are delegated to the shared model server
+# (see llm/model_server.py) instead of loading the models in this process.
+# MODEL_SERVER_KEY is the shared secret both sides authenticate with; there
+# is no default, the server refuses to start without one.
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET")
+MODEL_SERVER_KEY = os.getenv("MODEL_SERVER_KEY", "").encode()
+
+# Messages are sent as bytes, never pickled: a JSON header line followed by
+# a raw body.
+#   -> {"op": "embed"}  body: JSON list of texts
+#   -> {"op": "ocr"}    body: image bytes
+#   -> {"op": "ping"}
+#   <- {"status": "ok", "shape": [n, dim]}  body: float32 vectors   (embed)
+#   <- {"status": "ok"}                     body: utf-8 text        (ocr, ping)
+#   <- {"status": "error", "error": str}
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+_local = threading.local()
+
+
+def pack(header: dict, body: bytes = b"") -> bytes:
+    return orjson.dumps(header) + b"\n" + body
+
+
+def unpack(message: bytes) -> Tuple[dict, bytes]:
+    header, _, body = message.partition(b"\n")
+    return orjson.loads(header), body
+
+
+def _connection():
+    # Connections are not thread safe, so each thread keeps its own
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        if not MODEL_SERVER_KEY:
+            raise RuntimeError("MODEL_SERVER_KEY must be set to use the model server")
+        conn = Client(MODEL_SERVER_SOCKET, family="AF_UNIX", authkey=MODEL_SERVER_KEY)
+        _local.conn = conn
+    return conn
+
+
+def call(op: str, body: bytes = b"") -> Tuple[dict, bytes]:
+    for attempt in range(2):
+        try:
+            conn = _connection()
+            conn.send_bytes(pack({"op": op}, body))
+            header, result = unpack(conn.recv_bytes(MAX_MESSAGE_BYTES))
+            break
+        except (EOFError, OSError):
+            # The server restarted, reconnect once
+            _local.conn = None
+            if attempt:
+                raise
+    if header.get("status") != "ok":
+        raise RuntimeError(f"Model server {op} failed: {header.get('error')}")
+    return header, result
+
+
+class RemoteEmbeddings:
+    """Drop-in for SentenceTransformer.encode backed by the model server."""
+
+    def __init__(self):
+        call("ping")
+
+    def encode(self, sentences: Union[str, List[str]], **kwargs):
+        texts = [sentences] if isinstance(sentences, str) else list(sentences)
+        header, body = call("embed", orjson.dumps(texts))
+        vectors = np.frombuffer(body, dtype=np.float32).reshape(header["shape"])
+        return vectors[0] if isinstance(sentences, str) else vectors
+
+
+def ocr(image: bytes) -> str:
+    return call("ocr", image)[1].decode("utf-8")
@@ -0,0 +1,140 @@
+"""
+Local model server shared by every API worker on a host.
+
+Run it next to uvicorn and point the workers at its socket:
+
+    export MODEL_SERVER_KEY=<random secret>
+    python -m llm.model_server                        (from src/)
+    MODEL_SERVER_SOCKET=/tmp/docquer-models.sock uvicorn app:app --workers 4
+
+The socket is only accessible to the user running the server, and clients
+must also authenticate with MODEL_SERVER_KEY.
+
+It owns the only copy of the embedding and OCR models. Embedding requests
+from all connections are coalesced into shared batches before encoding.
+"""
+import os
+import queue
+import threading
+import time
+import numpy as np
+import orjson
+from concurrent.futures import Future
+from multiprocessing.connection import Listener
+from typing import List
+from .embeddings import load_embeddings_model
+from .extractors import recognize
+from .model_client import MODEL_SERVER_SOCKET, MODEL_SERVER_KEY, MAX_MESSAGE_BYTES, pack, unpack
+
+DEFAULT_SOCKET = "/tmp/docquer-models.sock"
+# Requests arriving within BATCH_WINDOW of each other share one encode call
+BATCH_WINDOW = float(os.getenv("MODEL_SERVER_BATCH_WINDOW", "0.005"))
+MAX_BATCH_TEXTS = int(os.getenv("MODEL_SERVER_MAX_BATCH", "256"))
+
+
+class EmbeddingBatcher:
+    def __init__(self, model):
+        self.model = model
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def submit(self, texts: List[str]) -> Future:
+        future = Future()
+        self.requests.put((texts, future))
+        return future
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        count = len(batch[0][0])
+        deadline = time.monotonic() + BATCH_WINDOW
+        while count < MAX_BATCH_TEXTS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request, _ in batch for text in request]
+            try:
+                vectors = self.model.encode(texts)
+                offset = 0
+                for request, future in batch:
+                    future.set_result(vectors[offset:offset + len(request)])
+                    offset += len(request)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+def serve_connection(conn, batcher: EmbeddingBatcher, ocr_lock: threading.Lock):
+    with conn:
+        while True:
+            try:
+                message = conn.recv_bytes(MAX_MESSAGE_BYTES)
+            except (EOFError, OSError):
+                return
+            try:
+                header, body = unpack(message)
+                match header.get("op"):
+                    case "embed":
+                        texts = orjson.loads(body)
+                        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                            raise ValueError("embed expects a list of strings")
+                        vectors = np.ascontiguousarray(batcher.submit(texts).result(), dtype=np.float32)
+                        reply = pack({"status": "ok", "shape": list(vectors.shape)}, vectors.tobytes())
+                    case "ocr":
+                        # easyocr is not safe to call from several threads at once
+                        with ocr_lock:
+                            reply = pack({"status": "ok"}, recognize(body).encode("utf-8"))
+                    case "ping":
+                        reply = pack({"status": "ok"}, b"pong")
+                    case op:
+                        raise ValueError(f"Unknown operation '{op}'")
+            except Exception as e:
+                reply = pack({"status": "error", "error": str(e)})
+            conn.send_bytes(reply)
+
+
+def main():
+    if not MODEL_SERVER_KEY:
+        raise SystemExit("MODEL_SERVER_KEY must be set to a secret shared with the API workers")
+    address = MODEL_SERVER_SOCKET or DEFAULT_SOCKET
+    if os.path.exists(address):
+        os.remove(address)
+
+    print("Loading models...")
+    batcher = EmbeddingBatcher(load_embeddings_model())
+    ocr_lock = threading.Lock()
+    with ocr_lock:
+        from .extractors import ocr_reader
+        ocr_reader.get()
+
+    # Bind with a umask so the socket is never reachable by other users
+    umask = os.umask(0o077)
+    try:
+        listener = Listener(address, family="AF_UNIX", authkey=MODEL_SERVER_KEY)
+    finally:
+        os.umask(umask)
+    os.chmod(address, 0o600)
+    with listener:
+        print(f"Model server listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"Error accepting model client: {e}")
+                continue
+            threading.Thread(target=serve_connection, args=(conn, batcher, ocr_lock), daemon=True).start()
+
+
+if __name__ == "__main__":
+    main()
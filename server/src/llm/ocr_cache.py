@@ -0,0 +1,96 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+from typing import Optional
+
+# OCR results keyed by the sha256 of the image bytes, kept in a small sqlite
+# file so they survive restarts and are shared by every worker on the host.
+# The least recently used entries are evicted once the stored text exceeds
+# OCR_CACHE_MAX_MB. Set OCR_CACHE_MAX_MB=0 to turn the cache off.
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "/tmp/docquer-ocr-cache.sqlite3")
+OCR_CACHE_MAX_BYTES = int(float(os.getenv("OCR_CACHE_MAX_MB", "64")) * 1024 * 1024)
+
+# Images smaller than this on either side, or with almost no contrast, are
+# not worth sending to the OCR model
+OCR_MIN_SIDE = int(os.getenv("OCR_MIN_SIDE", "24"))
+OCR_MIN_CONTRAST = int(os.getenv("OCR_MIN_CONTRAST", "16"))
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+
+def image_key(image: bytes) -> str:
+    return hashlib.sha256(image).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(OCR_CACHE_PATH, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS ocr (key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ocr_used ON ocr (used)")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def get(key: str) -> Optional[str]:
+    if OCR_CACHE_MAX_BYTES <= 0:
+        return None
+    try:
+        with _lock:
+            conn = _connect()
+            row = conn.execute("SELECT text FROM ocr WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE ocr SET used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        print(f"OCR cache read failed: {e}")
+        return None
+
+
+def put(key: str, text: str):
+    if OCR_CACHE_MAX_BYTES <= 0:
+        return
+    size = len(text.encode("utf-8")) + len(key)
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute("INSERT OR REPLACE INTO ocr (key, text, size, used) VALUES (?, ?, ?, ?)", (key, text, size, time.time()))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr").fetchone()[0]
+            if total > OCR_CACHE_MAX_BYTES:
+                _evict(conn, total - int(OCR_CACHE_MAX_BYTES * 0.9))
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"OCR cache write failed: {e}")
+
+
+def _evict(conn: sqlite3.Connection, excess: int):
+    freed = 0
+    stale = []
+    for key, size in conn.execute("SELECT key, size FROM ocr ORDER BY used"):
+        if freed >= excess:
+            break
+        stale.append((key,))
+        freed += size
+    conn.executemany("DELETE FROM ocr WHERE key = ?", stale)
+
+
+def worth_reading(image: bytes) -> bool:
+    """Cheap pre-filter for tiny and blank images, decoding only a thumbnail."""
+    try:
+        from PIL import Image
+        with Image.open(BytesIO(image)) as img:
+            if min(img.size) < OCR_MIN_SIDE:
+                return False
+            img.draft("L", (64, 64))
+            low, high = img.convert("L").getextrema()
+        return high - low >= OCR_MIN_CONTRAST
+    except Exception:
+        # Let the OCR model decide on anything we can't inspect
+        return True
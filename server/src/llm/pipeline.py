@@ -0,0 +1,159 @@
+import queue
+import threading
+import uuid
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Tuple
+from fastapi import HTTPException
+from metrics import timed
+from .constants import ChunkRecord, get_index
+from .embeddings import encode_by_length
+from .writer import BulkWriter
+from . import chunk_store
+
+if TYPE_CHECKING:
+    from pinecone import Index
+
+# Chunks are embedded in fixed size batches and handed to a BulkWriter that
+# upserts them concurrently. Both hand-offs are bounded so only a handful of
+# batches are ever held in memory, whatever the document size. Chunks are
+# queued EMBED_WINDOW at a time and sorted by token length within a window,
+# so each batch pads to similar lengths.
+EMBED_BATCH_SIZE = 64
+EMBED_WINDOW = 4 * EMBED_BATCH_SIZE
+# Pinecone deletes at most 1000 ids per request
+DELETE_BATCH_SIZE = 1000
+CHUNK_QUEUE_SIZE = 4
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce_batches(chunks: Iterable[ChunkRecord], out: queue.Queue, stop: threading.Event):
+    # Runs extraction and chunking (the iteration of `chunks`) off the
+    # embedding thread so the two overlap.
+    try:
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) == EMBED_WINDOW:
+                if not _put(out, batch, stop):
+                    return
+                batch = []
+        if batch and not _put(out, batch, stop):
+            return
+        _put(out, _DONE, stop)
+    except Exception as e:
+        _put(out, _Failure(e), stop)
+
+
+def _to_vectors(conv_id: str, batch: List[ChunkRecord]) -> List[dict]:
+    # The texts go to the chunk store before their vectors become queryable;
+    # the vectors keep only the page provenance as metadata
+    with timed("embed", "ingest"):
+        embeddings = encode_by_length([chunk["text"] for chunk in batch], EMBED_BATCH_SIZE)
+    ids = [str(uuid.uuid4()) for _ in batch]
+    chunk_store.put_many(conv_id, zip(ids, (chunk["text"] for chunk in batch)))
+    return [{
+        "id": ids[i],
+        "values": embedding.tolist(),
+        "metadata": {key: value for key, value in batch[i].items() if key != "text"}
+    } for i, embedding in enumerate(embeddings)]
+
+
+def insert_data(conv_id: str, chunks: Iterable[ChunkRecord], replace: bool = False) -> int:
+    index = get_index(conv_id)
+
+    # If replace is True, delete existing vectors
+    if replace:
+        try:
+            index.delete(delete_all=True)
+            chunk_store.delete_conv(conv_id)
+        except Exception as e:
+            print(f"Error deleting vectors: {e}")
+
+    batches = queue.Queue(maxsize=CHUNK_QUEUE_SIZE)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce_batches, args=(chunks, batches, stop), daemon=True)
+    producer.start()
+
+    writer = BulkWriter(index)
+    total = 0
+    written: List[str] = []
+    try:
+        while True:
+            item = batches.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            vectors = _to_vectors(conv_id, item)
+            written.extend(vector["id"] for vector in vectors)
+            writer.add_many(vectors)
+            total += len(item)
+
+        report = writer.close()
+        print(f"Indexed {total} chunks into docquer-{conv_id}: {report}")
+        return total
+    except HTTPException:
+        writer.abort()
+        _forget(index, written)
+        raise
+    except Exception as e:
+        writer.abort()
+        _forget(index, written)
+        print(f"Error inserting data: {e}")
+        raise HTTPException(status_code=500, detail=f"Error inserting data: {str(e)}")
+    finally:
+        stop.set()
+
+
+def _forget(index: "Index", ids: List[str]):
+    # Undoes a failed ingestion. Vectors left without their texts would
+    # still take top_k slots and then be dropped by with_texts. abort() has
+    # waited for in-flight upserts, so none land after this.
+    try:
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            index.delete(ids=ids[start:start + DELETE_BATCH_SIZE])
+    except Exception as e:
+        print(f"Error deleting vectors: {e}")
+    try:
+        chunk_store.delete_ids(ids)
+    except Exception as e:
+        print(f"Error deleting chunk texts: {e}")
+
+
+def _stored_pages(conv_id: str, page_size: int) -> Iterator[List[Tuple[str, List[float], dict]]]:
+    # Reads back what insert_data wrote, one page of vector ids at a time
+    index = get_index(conv_id)
+    for ids in index.list(limit=page_size):
+        with timed("vector_fetch"):
+            fetched = index.fetch(ids=list(ids))
+        yield [(id, vector.values, dict(vector.metadata)) for id, vector in fetched.vectors.items() if vector.metadata]
+
+
+def stored_vectors(conv_id: str, page_size: int = 100) -> Iterator[Tuple[str, List[float], dict]]:
+    # Vector ids, values and metadata; the metadata has no text (see chunk_store)
+    for page in _stored_pages(conv_id, page_size):
+        yield from page
+
+
+def stored_chunks(conv_id: str, page_size: int = 100) -> Iterator[ChunkRecord]:
+    for page in _stored_pages(conv_id, page_size):
+        texts = chunk_store.get_many([id for id, _, metadata in page if not metadata.get("text")])
+        for id, _, metadata in page:
+            text = metadata.get("text") or texts.get(id)
+            if text:
+                yield {**metadata, "text": text}
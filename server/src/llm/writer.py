@@ -0,0 +1,150 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, List
+from metrics import timed
+
+if TYPE_CHECKING:
+    from pinecone import Index
+
+# Pinecone rejects upsert requests above 2MB or 1000 vectors. Batches are
+# sized by an estimate of their encoded size so that chunks carrying long
+# metadata still fit, while short chunks are packed into fewer requests.
+MAX_REQUEST_BYTES = 2 * 1024 * 1024
+MAX_BATCH_VECTORS = 1000
+PAYLOAD_HEADROOM = 0.8
+# Smaller batches than the hard limit keep several requests in flight at once
+TARGET_BATCH_VECTORS = 200
+
+UPSERT_WORKERS = 4
+MAX_PENDING_BATCHES = UPSERT_WORKERS * 2
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+# ConnectionError and TimeoutError are OSErrors; the Pinecone client
+# raises urllib3's own errors for broken connections
+try:
+    from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError, TimeoutError as Urllib3Timeout
+    NETWORK_ERRORS = (OSError, MaxRetryError, NewConnectionError, ProtocolError, Urllib3Timeout)
+except ImportError:
+    NETWORK_ERRORS = (OSError,)
+
+
+def estimate_size(vector: dict) -> int:
+    # Float values serialise to ~20 characters each in the JSON request body
+    return len(vector["id"]) + len(vector["values"]) * 20 + len(json.dumps(vector.get("metadata", {})))
+
+
+def is_retryable(error: Exception) -> bool:
+    # Throttling, server errors and network failures are transient; anything
+    # else (a malformed vector, a 4xx) fails the same way on every attempt
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, NETWORK_ERRORS)
+
+
+def is_too_large(error: Exception) -> bool:
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    return status == 413 or "too large" in str(error).lower()
+
+
+class BulkWriter:
+    """
+    Upserts vectors into an index with bounded parallelism. Vectors are
+    grouped into batches that stay under the request payload limit, each
+    batch is retried with jittered exponential backoff, and a batch rejected
+    as too large is split in half and retried.
+    """
+
+    def __init__(self, index: "Index", workers: int = UPSERT_WORKERS, max_pending: int = MAX_PENDING_BATCHES,
+                 max_bytes: int = int(MAX_REQUEST_BYTES * PAYLOAD_HEADROOM), max_vectors: int = TARGET_BATCH_VECTORS):
+        self.index = index
+        self.max_bytes = max_bytes
+        self.max_vectors = min(max_vectors, MAX_BATCH_VECTORS)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.pending: List[Future] = []
+        self.batch: List[dict] = []
+        self.batch_bytes = 0
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stats = {"vectors": 0, "batches": 0, "bytes": 0, "retries": 0}
+
+    def add(self, vector: dict):
+        size = estimate_size(vector)
+        if self.batch and (self.batch_bytes + size > self.max_bytes or len(self.batch) >= self.max_vectors):
+            self._submit()
+        self.batch.append(vector)
+        self.batch_bytes += size
+
+    def add_many(self, vectors: List[dict]):
+        for vector in vectors:
+            self.add(vector)
+        self._raise_failures()
+
+    def close(self) -> dict:
+        try:
+            if self.batch:
+                self._submit()
+            for future in self.pending:
+                future.result()
+        finally:
+            self.pool.shutdown(wait=True)
+        return self.report()
+
+    def abort(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        with self.lock:
+            report = dict(self.stats)
+        report["seconds"] = round(elapsed, 3)
+        report["vectors_per_second"] = round(report["vectors"] / elapsed, 1) if elapsed else 0.0
+        report["mb_per_second"] = round(report["bytes"] / elapsed / 1024 / 1024, 2) if elapsed else 0.0
+        return report
+
+    def _submit(self):
+        batch, size = self.batch, self.batch_bytes
+        self.batch, self.batch_bytes = [], 0
+        self.slots.acquire()
+        future = self.pool.submit(self._upsert, batch, size)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.pending.append(future)
+
+    def _raise_failures(self):
+        # Surface upsert failures as soon as they happen
+        for future in self.pending:
+            if future.done():
+                future.result()
+        self.pending = [future for future in self.pending if not future.done()]
+
+    def _upsert(self, batch: List[dict], size: int):
+        attempt = 0
+        while True:
+            try:
+                with timed("vector_upsert"):
+                    self.index.upsert(vectors=batch)
+                with self.lock:
+                    self.stats["vectors"] += len(batch)
+                    self.stats["batches"] += 1
+                    self.stats["bytes"] += size
+                return
+            except Exception as e:
+                if len(batch) > 1 and is_too_large(e):
+                    half = len(batch) // 2
+                    self._upsert(batch[:half], size // 2)
+                    self._upsert(batch[half:], size - size // 2)
+                    return
+                attempt += 1
+                if attempt > MAX_RETRIES or not is_retryable(e):
+                    raise
+                with self.lock:
+                    self.stats["retries"] += 1
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+                print(f"Upsert of {len(batch)} vectors failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
@@ -0,0 +1,92 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, TypeVar
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+T = TypeVar("T")
+
+# Latency of every pipeline stage. `stage` is one of http, mongo, embed,
+# vector_query, vector_upsert, vector_fetch, library, extract, ocr or llm;
+# `target` narrows it down (route, collection:operation, file type, LLM call
+# name...).
+STAGE_SECONDS = Histogram(
+    "docquer_stage_seconds", "Latency of a pipeline stage",
+    ["stage", "target"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+LLM_TOKENS = Counter("docquer_llm_tokens_total", "Tokens used by LLM calls", ["call", "kind"])
+CACHE_REQUESTS = Counter("docquer_cache_requests_total", "Cache lookups", ["cache", "result"])
+ADMISSION_QUEUED = Gauge("docquer_admission_queued", "Requests waiting for admission", ["scope"], multiprocess_mode="livesum")
+ADMISSION_IN_FLIGHT = Gauge("docquer_admission_in_flight_units", "Admitted work units in flight", ["scope"], multiprocess_mode="livesum")
+ADMISSION_REJECTED = Counter("docquer_admission_rejected_total", "Requests rejected with 429", ["operation", "reason"])
+COALESCED = Counter("docquer_coalesced_requests_total", "Duplicate requests that awaited an in-flight call", ["operation"])
+
+# Label children are cached, so the hot path is a dict lookup plus observe()
+_children = {}
+
+
+def _child(stage: str, target: str):
+    key = (stage, target)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = STAGE_SECONDS.labels(stage, target)
+    return child
+
+
+def observe(stage: str, target: str, seconds: float):
+    _child(stage, target).observe(seconds)
+
+
+@contextmanager
+def timed(stage: str, target: str = ""):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _child(stage, target).observe(time.perf_counter() - started)
+
+
+def timed_iter(iterable: Iterator[T], stage: str, target: str = "") -> Iterator[T]:
+    # For generators only the time spent producing items is counted, not the
+    # time the consumer spends between items
+    iterator = iter(iterable)
+    spent = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                spent += time.perf_counter() - started
+            yield item
+    finally:
+        _child(stage, target).observe(spent)
+
+
+def record_tokens(call: str, message):
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage.get("input_tokens"):
+        LLM_TOKENS.labels(call, "prompt").inc(usage["input_tokens"])
+    if usage.get("output_tokens"):
+        LLM_TOKENS.labels(call, "completion").inc(usage["output_tokens"])
+
+
+def cache_result(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def render() -> bytes:
+    # With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR so that
+    # every worker's samples are aggregated
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+content_type = CONTENT_TYPE_LATEST
@@ -45,4 +45,8 @@ class DeleteConversatoin(BaseModel):
 
 class UploadLink(BaseModel):
     link: str
-    conv_id: str
\ No newline at end of file
+    conv_id: str
+
+class LibrarySearch(BaseModel):
+    query: str
+    k: int = 10
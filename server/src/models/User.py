@@ -7,12 +7,14 @@ class User(BaseModel):
     password: Optional[str] = None
     groq_api_key: str
     GoogleRegister: bool
+    idToken: Optional[str] = None  # Firebase ID token, required with GoogleRegister
 
 class LoginRequest(BaseModel):
     email: str
     username: Optional[str] = None
     password: Optional[str] = None
     GoogleLogin: bool
+    idToken: Optional[str] = None  # Firebase ID token, required with GoogleLogin
 
 class UpdateGroq(BaseModel):
     id: str
@@ -1,12 +1,28 @@
 import os
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
+from lazy import Lazy
 
 api_key = os.getenv("PINECONE_KEY")
 
-pc = Pinecone(api_key=api_key)
+# all-MiniLM-L6-v2 embedding size
+dimension = 384
 
-spec = ServerlessSpec(
-    cloud='aws',
-    region='us-east-1'
-)
\ No newline at end of file
+
+def _connect():
+    from pinecone import Pinecone
+    return Pinecone(api_key=api_key)
+
+
+pinecone_client = Lazy("pinecone", _connect)
+
+
+def get_pc():
+    return pinecone_client.get()
+
+
+def get_spec():
+    from pinecone import ServerlessSpec
+    return ServerlessSpec(
+        cloud='aws',
+        region='us-east-1'
+    )
@@ -0,0 +1,132 @@
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from typing import List, Optional
+from fastapi import Request
+
+# Opt-in request profiling. A request is profiled when it carries
+# "X-Profile: <PROFILE_TOKEN>", or while the admin toggle
+# (POST /debug/profile-next) still has requests left to capture. Profiles are
+# pyinstrument HTML reports stored in PROFILE_DIR. Nothing is profiled when
+# PROFILE_TOKEN is unset.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/docquer-profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+# Event-loop watchdog, always on unless LOOP_BLOCK_THRESHOLD is 0
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.5"))
+
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def authorized(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def profile_next(count: int):
+    global _pending
+    with _pending_lock:
+        _pending = max(0, count)
+
+
+def should_profile(request: Request) -> bool:
+    global _pending
+    if not PROFILE_TOKEN:
+        return False
+    if authorized(request.headers.get("x-profile")):
+        return True
+    if _pending and not request.url.path.startswith("/debug"):
+        with _pending_lock:
+            if _pending:
+                _pending -= 1
+                return True
+    return False
+
+
+async def profile(request: Request, call_next):
+    from pyinstrument import Profiler
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        html = profiler.output_html()
+        await asyncio.to_thread(_store, profile_id, request.method, request.url.path, html)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+def _store(profile_id: str, method: str, path: str, html: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{profile_id}{path.replace('/', '_')}.html"
+    with open(os.path.join(PROFILE_DIR, name), "w") as f:
+        f.write(html)
+    print(f"Stored profile {profile_id} for {method} {path}")
+    for old in list_profiles()[PROFILE_KEEP:]:
+        os.remove(os.path.join(PROFILE_DIR, old))
+
+
+def list_profiles() -> List[str]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((f for f in os.listdir(PROFILE_DIR) if f.endswith(".html")), reverse=True)
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    for name in list_profiles():
+        if name.startswith(profile_id):
+            return os.path.join(PROFILE_DIR, name)
+    return None
+
+
+class LoopWatchdog:
+    """
+    A heartbeat task on the event loop plus a thread that checks it. When the
+    loop misses its heartbeat for longer than the threshold, the stack of the
+    loop's thread is printed, which points at the blocking call.
+    """
+
+    def __init__(self, threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.threshold = threshold
+        self.beat = time.monotonic()
+        self.loop_thread_id = None
+        self.stalls = 0
+
+    async def _heartbeat(self):
+        interval = self.threshold / 5
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(interval)
+
+    def _watch(self):
+        reported = None
+        while True:
+            time.sleep(self.threshold / 2)
+            beat = self.beat
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold or reported == beat:
+                continue
+            reported = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "  <stack unavailable>\n"
+            print(f"Event loop blocked for {blocked:.2f}s (threshold {self.threshold}s), loop thread stack:\n{stack}")
+
+    def start(self):
+        if self.threshold <= 0:
+            return
+        self.loop_thread_id = threading.get_ident()
+        asyncio.get_running_loop().create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+
+watchdog = LoopWatchdog()
@@ -0,0 +1,92 @@
+import gzip
+import hashlib
+import os
+import re
+from typing import Any, Iterable, Optional, Tuple
+import orjson
+from urllib.parse import quote
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+# Bodies at least this large are compressed, with brotli when the client
+# accepts it and the brotli package is installed, otherwise gzip
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+# Compressing a long history takes milliseconds of CPU, so bodies at least
+# this large are compressed in the thread pool instead of on the event loop
+COMPRESS_OFFLOAD_BYTES = int(os.getenv("COMPRESS_OFFLOAD_BYTES", str(64 * 1024)))
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class FastJSONResponse(Response):
+    """
+    Serializes with orjson, skipping FastAPI's jsonable_encoder. Datetimes are
+    written as ISO strings like before; ObjectIds and other unknown types fall
+    back to str().
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _accepts(request: Request, encoding: str) -> bool:
+    accepted = request.headers.get("accept-encoding", "")
+    return any(part.split(";")[0].strip() == encoding for part in accepted.split(","))
+
+
+def compressed(request: Request, response: Response) -> Response:
+    body = response.body
+    if len(body) < COMPRESS_MIN_BYTES or "content-encoding" in response.headers:
+        return response
+    if brotli is not None and _accepts(request, "br"):
+        body, encoding = brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    elif _accepts(request, "gzip"):
+        body, encoding = gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    else:
+        return response
+    response.body = body
+    response.headers["content-encoding"] = encoding
+    response.headers["content-length"] = str(len(body))
+    response.headers["vary"] = "Accept-Encoding"
+    return response
+
+
+def etag_for(kind: str, versions: Iterable[Tuple[str, Any]]) -> str:
+    # Conversations carry a "version" counter bumped on every write, so the
+    # ids and versions alone identify the response
+    digest = hashlib.sha1(kind.encode())
+    for id, version in versions:
+        digest.update(f"|{id}:{version or 0}".encode())
+    return f'W/"{digest.hexdigest()[:20]}"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+async def json_response(request: Request, content: Any, etag: Optional[str] = None, status_code: int = 200) -> Response:
+    response = FastJSONResponse(content=content, status_code=status_code)
+    if etag:
+        response.headers["ETag"] = etag
+        # Revalidate every time, the 304 path is cheap
+        response.headers["Cache-Control"] = "private, no-cache"
+    if len(response.body) >= COMPRESS_OFFLOAD_BYTES:
+        return await run_in_threadpool(compressed, request, response)
+    return compressed(request, response)
+
+
+def attachment(filename: str) -> str:
+    # Header values must be latin-1, so non-ASCII names go in the RFC 5987
+    # filename* parameter with an ASCII-only filename= fallback
+    fallback = re.sub(r'[^A-Za-z0-9._-]+', "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
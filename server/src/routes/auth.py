@@ -1,40 +1,38 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from fastapi.responses import JSONResponse
 from db import MongoDB
 from models.User import User, LoginRequest, UpdateUser
 from bson import ObjectId
-import bcrypt
+from security import hash_password, verify_password, issue_token, session, verify_google_email
+from typing import Optional
 
 router = APIRouter()
 db = MongoDB()
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
 @router.post("/register")
 async def register(user: User):
+    if user.GoogleRegister and not await verify_google_email(user.idToken, user.email):
+        return JSONResponse(status_code=401, content={"error": "Google sign-in could not be verified"})
     existing_user = await db.find("users", {"email": user.email})
     if existing_user and user.GoogleRegister:
         existing_user[0]['_id'] = str(existing_user[0]['_id'])
-        return {'data': existing_user[0]}
+        existing_user[0].pop('password', None)
+        return {'data': existing_user[0], 'token': issue_token(existing_user[0]['_id'], existing_user[0]['username'])}
     if existing_user:
         return JSONResponse(status_code=400, content={"error": "Username already exists"})
     else:
         user_data = user.model_dump()
         user_data["convos"] = []
         if not user.GoogleRegister:
-            user_data["password"] = hash_password(user_data["password"])
-        new_user = {k: v for k, v in user_data.items() if k != 'password' and k != 'GoogleRegister'}
+            user_data["password"] = await hash_password(user_data["password"])
+        new_user = {k: v for k, v in user_data.items() if k not in ('GoogleRegister', 'idToken') and not (k == 'password' and v is None)}
         await db.insert("users", new_user)
         return {"message": "success"}
     
 @router.post("/login")
 async def login(req: LoginRequest):
+    if req.GoogleLogin and not await verify_google_email(req.idToken, req.email):
+        return JSONResponse(status_code=401, content={"error": "Google sign-in could not be verified"})
     user = await db.find("users", {
         'email': req.email
     })
@@ -44,22 +42,28 @@ async def login(req: LoginRequest):
     elif len(user) == 0 and req.GoogleLogin:
        user_data = req.model_dump()
        user_data['convos'] = []
-       new_user = {k: v for k, v in user_data.items() if k != 'password' and k != 'GoogleRegister'}
+       new_user = {k: v for k, v in user_data.items() if k not in ('password', 'GoogleRegister', 'idToken')}
        id = await db.insert("users", new_user)
        new_user['_id'] = str(id)
-       return {"data": new_user}
+       return {"data": new_user, "token": issue_token(new_user['_id'], new_user['username'])}
 
     user[0]['_id'] = str(user[0]['_id'])
+    hashed_password = user[0].get('password')
 
-    user = {k: v for k, v in user[0].items() if k != 'groq_api_key' and k != 'GoogleLogin'}
+    user = {k: v for k, v in user[0].items() if k not in ('groq_api_key', 'GoogleLogin', 'password')}
     
-    if req.GoogleLogin:
-        return {"data": user}
+    if not req.GoogleLogin:
+        if not hashed_password or not req.password or not await verify_password(req.password, hashed_password):
+            return JSONResponse(status_code=400, content={"error": "Passwords doesnt match"})
     
-    if not verify_password(req.password, user[0]["password"]):
-        return JSONResponse(status_code=400, content={"error": "Passwords doesnt match"})
-    
-    return {"data": user}
+    return {"data": user, "token": issue_token(user['_id'], user['username'])}
+
+@router.get("/session")
+async def current_session(claims: Optional[dict] = Depends(session)):
+    # Verifies the token signature only, no database round-trip
+    if not claims:
+        return JSONResponse(status_code=401, content={"error": "Invalid or expired session"})
+    return {"data": {"_id": claims["sub"], "username": claims["name"]}, "expires": claims["exp"]}
 
 @router.post("/update")
 async def update(req: UpdateUser):
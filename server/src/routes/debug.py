@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
+from typing import Optional
+import profiling
+import cleanup
+
+router = APIRouter()
+
+
+def forbidden():
+    return JSONResponse(content={"error": "Profiling is disabled or the token is wrong"}, status_code=403)
+
+
+@router.post("/profile-next")
+async def profile_next(count: int = 1, x_profile_token: Optional[str] = Header(None)):
+    if not profiling.authorized(x_profile_token):
+        return forbidden()
+    profiling.profile_next(count)
+    return {"message": f"profiling the next {count} requests"}
+
+
+@router.get("/profiles")
+async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    if not profiling.authorized(x_profile_token):
+        return forbidden()
+    return {"profiles": profiling.list_profiles()}
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    if not profiling.authorized(x_profile_token):
+        return forbidden()
+    path = None if "/" in profile_id else profiling.profile_path(profile_id)
+    if not path:
+        return JSONResponse(content={"error": "Profile not found"}, status_code=404)
+    return FileResponse(path, media_type="text/html")
+
+
+@router.get("/loop")
+async def loop_stalls(x_profile_token: Optional[str] = Header(None)):
+    if not profiling.authorized(x_profile_token):
+        return forbidden()
+    return {"threshold": profiling.watchdog.threshold, "stalls": profiling.watchdog.stalls}
+
+
+@router.post("/sweep")
+async def sweep(x_profile_token: Optional[str] = Header(None)):
+    if not profiling.authorized(x_profile_token):
+        return forbidden()
+    return await run_in_threadpool(cleanup.sweep)
+
+
+@router.get("/sweep")
+async def last_sweep(x_profile_token: Optional[str] = Header(None)):
+    if not profiling.authorized(x_profile_token):
+        return forbidden()
+    return {"report": cleanup.last_report}
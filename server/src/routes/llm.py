@@ -1,16 +1,28 @@
-from fastapi import APIRouter, UploadFile, File, Form
+from fastapi import APIRouter, UploadFile, File, Form, Request, Depends, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse, StreamingResponse
 from db import MongoDB
 from models.User import UpdateGroq
-from models.Chat import NormalChat, NewChat, GetConvos, GetMessages, FileChat, GetConvDetails, DeleteConversatoin, UploadLink
+from models.Chat import NormalChat, NewChat, GetConvos, GetMessages, FileChat, GetConvDetails, DeleteConversatoin, UploadLink, LibrarySearch
 from bson import ObjectId
-from llm.model import normal_chat, title_recommender, subtitle_recommender, file_chat, create_index, replace_index, delete_index, get_link_data, get_youtube_transcript, update_index, normal_chat_stream
+from llm.model import normal_chat, title_recommender, subtitle_recommender, file_chat, create_index, replace_index, get_link_data, get_youtube_transcript, update_index, normal_chat_stream
 from datetime import datetime
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+import os
+from admission import admit, client_key
+from security import session
+from singleflight import uploads, links, chats, digest_upload
+from cleanup import cascade
+from responses import json_response, etag_for, not_modified, attachment
+from transfer import export_lines, import_lines
+from llm.library import search_library
 
 bucket_name = "docquer_bucket"
 
+# Write chat turns after the response has been sent instead of before it
+PERSIST_IN_BACKGROUND = os.getenv("PERSIST_IN_BACKGROUND", "0") == "1"
+
 router = APIRouter()
 db = MongoDB()
 
@@ -28,34 +40,56 @@ async def update_api_key(req: UpdateGroq):
     else:
         raise JSONResponse(content={"error": "User not found"}, status_code=404)
     
+async def write_turn(conv_id: str, docs: List[dict], metadata: Optional[dict] = None):
+    try:
+        await db.insert_many("Message", docs)
+        update = {"$push": {"messages": {"$each": [str(doc["_id"]) for doc in docs]}}, "$inc": {"version": 1}}
+        if metadata:
+            update["$set"] = metadata
+        await db.update("convos", {"_id": ObjectId(conv_id)}, update)
+    except Exception as e:
+        if not PERSIST_IN_BACKGROUND:
+            raise
+        print(f"Error persisting turn for {conv_id}: {e}")
+
+async def save_turn(conv_id: str, query: str, reply: str, background: BackgroundTasks, metadata: Optional[dict] = None) -> List[str]:
+    # Ids are generated here so they can be returned before the write lands
+    docs = [
+        {"_id": ObjectId(), "sender": "user", "text": query, "createTime": datetime.now()},
+        {"_id": ObjectId(), "sender": "bot", "text": reply}
+    ]
+    if PERSIST_IN_BACKGROUND:
+        background.add_task(write_turn, conv_id, docs, metadata)
+    else:
+        await write_turn(conv_id, docs, metadata)
+    return [str(doc["_id"]) for doc in docs]
+
 @router.post("/normal-chat")
-async def normal(req: NormalChat):
-    messages = await db.find_by_ids("Message", req.messageIds)
-    user = await db.find("users", {'username': req.username})
-    api_key = user[0]['groq_api_key']
-    res = normal_chat(req.username, api_key, req.query, messages)
-    if res.get('error'):
-        return JSONResponse(content={"error":"Something went wrong check the api"}, status_code=400)
-    user_msg_id = await db.insert("Message", {"sender": "user", "text": req.query, "createTime": datetime.now()})
+async def normal(req: NormalChat, request: Request, background: BackgroundTasks, claims: Optional[dict] = Depends(session)):
+    last_id = req.messageIds[-1] if req.messageIds else None
+    return await chats.do(("normal", req.conv_id, req.query, last_id), lambda: _normal(req, request, background, claims))
+
+async def _normal(req: NormalChat, request: Request, background: BackgroundTasks, claims: Optional[dict]):
+    async with admit(client_key(request, claims, req.username), "chat"):
+        messages = await db.find_by_ids("Message", req.messageIds)
+        user = await db.find("users", {'username': req.username})
+        api_key = user[0]['groq_api_key']
+        res = await run_in_threadpool(normal_chat, req.username, api_key, req.query, messages)
+        if res.get('error'):
+            return JSONResponse(content={"error":"Something went wrong check the api"}, status_code=400)
+        if len(messages) == 0:
+            title = await run_in_threadpool(title_recommender, api_key, req.query)
+            sub_title = await run_in_threadpool(subtitle_recommender, api_key, title, req.query)
     res = res['message']
-    bot_msg_id = await db.insert("Message", {"sender": "bot", "text": res.content})
+    metadata = None
     if len(messages) == 0:
-        title = title_recommender(api_key, req.query)
-        sub_title = subtitle_recommender(api_key, title, req.query)
-        await db.update("convos", {"_id": ObjectId(req.conv_id)}, {
-            "$set": {
+        metadata = {
             "firstMessage": req.query,
             "title": title,
             "subTitle": sub_title
-        }})
-    await db.update("convos", {"_id": ObjectId(req.conv_id)}, {
-        "$push": {
-            "messages": {
-                "$each": [str(user_msg_id), str(bot_msg_id)]
-            }
         }
-    })
-    return {"response": res, "messageIds": [str(user_msg_id), str(bot_msg_id)]}
+    message_ids = await save_turn(req.conv_id, req.query, res.content, background, metadata)
+    return {"response": res, "messageIds": message_ids}
 
 @router.post("/normal-chat-stream")
 def normal_chat_stream_endpoint(req: NormalChat):
@@ -71,29 +105,53 @@ def normal_chat_stream_endpoint(req: NormalChat):
         yield "data: [DONE]\n\n"
     return StreamingResponse(generate(), media_type="text/event-stream")
 
+async def ingest_key(request: Request, claims: Optional[dict], conv_id: str) -> str:
+    # Ingestion requests carry no username, so without a session the
+    # conversation's owner stands in for it, like req.username on the chat routes
+    username = None
+    if not claims and ObjectId.is_valid(conv_id):
+        conv = await db.find("convos", {"_id": ObjectId(conv_id)}, {"username": 1})
+        username = conv[0].get("username") if conv else None
+    return client_key(request, claims, username)
+
 @router.post("/upload-file")
-async def upload(file: UploadFile = File(...), conv_id: str = Form(...)):
+async def upload(request: Request, file: UploadFile = File(...), conv_id: str = Form(...), claims: Optional[dict] = Depends(session)):
+    key = await ingest_key(request, claims, conv_id)
+    async def run():
+        async with admit(key, "ingest"):
+            file_cont = await file.read()
+            return await _upload(file_cont, file.filename, file.content_type, conv_id)
+    return await uploads.do(("upload", conv_id, await digest_upload(file)), run)
+
+async def _upload(file_cont: bytes, filename: str, content_type: str, conv_id: str):
     try:
-        file_cont = await file.read()
-        create_index(file_cont, file.content_type, conv_id)
+        await run_in_threadpool(create_index, file_cont, content_type, conv_id)
 
-        await db.update("convos", {"_id": ObjectId(conv_id)}, {"$set": {"fileName": file.filename, "fileMime": file.content_type}})
+        await db.update("convos", {"_id": ObjectId(conv_id)}, {"$set": {"fileName": filename, "fileMime": content_type}, "$inc": {"version": 1, "indexVersion": 1}})
         return {"message": "success"}
     except Exception as e:
         print(e)
         return JSONResponse(content={"error": "error reading file"}, status_code=400)
 
 @router.post("/replace-file")
-async def replace_file(file: UploadFile = File(...), conv_id: str = Form(...)):
+async def replace_file(request: Request, file: UploadFile = File(...), conv_id: str = Form(...), claims: Optional[dict] = Depends(session)):
+    key = await ingest_key(request, claims, conv_id)
+    async def run():
+        async with admit(key, "ingest"):
+            file_cont = await file.read()
+            return await _replace_file(file_cont, file.filename, file.content_type, conv_id)
+    return await uploads.do(("replace", conv_id, await digest_upload(file)), run)
+
+async def _replace_file(file_cont: bytes, filename: str, content_type: str, conv_id: str):
     try:
-        file_cont = await file.read()
-        replace_index(file_cont, file.content_type, conv_id)
+        await run_in_threadpool(replace_index, file_cont, content_type, conv_id)
 
         await db.update("convos", {"_id": ObjectId(conv_id)}, {
             "$set": {
-                "fileName": file.filename,
-                "fileMime": file.content_type
-            }
+                "fileName": filename,
+                "fileMime": content_type
+            },
+            "$inc": {"version": 1, "indexVersion": 1}
         })
         
         return {"message": "success"}
@@ -102,45 +160,41 @@ async def replace_file(file: UploadFile = File(...), conv_id: str = Form(...)):
         return JSONResponse(content={"error": "error replacing file"}, status_code=400)
 
 @router.post("/file-chat")
-async def chat_with_file(req: FileChat):
-    messages = await db.find_by_ids("Message", req.messageIds)
-    user = await db.find("users", {'username': req.username})
+async def chat_with_file(req: FileChat, request: Request, background: BackgroundTasks, claims: Optional[dict] = Depends(session)):
+    last_id = req.messageIds[-1] if req.messageIds else None
+    return await chats.do(("file", req.conv_id, req.query, last_id), lambda: _chat_with_file(req, request, background, claims))
 
-    res = file_chat(user[0]['groq_api_key'], req.username, req.query, req.conv_id, messages)
+async def _chat_with_file(req: FileChat, request: Request, background: BackgroundTasks, claims: Optional[dict]):
+    async with admit(client_key(request, claims, req.username), "file_chat"):
+        messages = await db.find_by_ids("Message", req.messageIds)
+        user = await db.find("users", {'username': req.username})
+
+        res = await run_in_threadpool(file_chat, user[0]['groq_api_key'], req.username, req.query, req.conv_id, messages)
     if res.get('error'):
         return JSONResponse(content={"error": res['error']}, status_code=400)
     res = res['message']
 
     if len(res.content) > 0:
-        user_msg_id = await db.insert("Message", {
-            "sender": "user",
-            "text": req.query,
-            "createTime": datetime.now()
-        })
-        bot_msg_id = await db.insert("Message", {
-            "sender": "bot",
-            "text": res.content
-        })
-        await db.update("convos", {"_id": ObjectId(req.conv_id)}, {
-            "$push": {
-            "messages": {
-                "$each": [str(user_msg_id), str(bot_msg_id)]
-            }
-        }})
-        return {"response": res, "messageIds": [str(user_msg_id), str(bot_msg_id)]}
+        message_ids = await save_turn(req.conv_id, req.query, res.content, background)
+        return {"response": res, "messageIds": message_ids}
     
     return JSONResponse(content={"error": "got empty response"}, status_code=400)
     
 @router.post("/new-chat")
-async def new_chat(req: NewChat):
+async def new_chat(req: NewChat, request: Request, claims: Optional[dict] = Depends(session)):
     fileName = None if len(req.fileName) == 0 else req.fileName
     fileMime = None if len(req.fileMime) == 0 else req.fileMime
 
     user = await db.find("users", {'username': req.username})
     api_key = user[0]['groq_api_key']
 
-    new_title = title_recommender(api_key, req.firstMessage) if len(req.firstMessage) != 0 else "About " + req.fileName
-    new_subtitle = subtitle_recommender(api_key, new_title, req.firstMessage) if len(req.firstMessage) != 0 else "nothing mentioned"
+    if len(req.firstMessage) != 0:
+        async with admit(client_key(request, claims, req.username), "chat"):
+            new_title = await run_in_threadpool(title_recommender, api_key, req.firstMessage)
+            new_subtitle = await run_in_threadpool(subtitle_recommender, api_key, new_title, req.firstMessage)
+    else:
+        new_title = "About " + req.fileName
+        new_subtitle = "nothing mentioned"
     
     title = req.title if len(new_title) > 18 else new_title
     subtitle = "nothing mentioned" if len(new_subtitle) > 36 else new_subtitle
@@ -153,19 +207,28 @@ async def new_chat(req: NewChat):
         "subTitle": subtitle,
         "firstMessage": req.firstMessage,
         "createTime": datetime.now(),
-        "messages": []
+        "messages": [],
+        "version": 0
     })
 
     await db.update("users", {"username": req.username}, {"$push": {"convos": str(res2)}})
     return {"id": str(res2)}
 
+async def convos_etag(kind: str, ids: List[str]) -> str:
+    versions = await db.find_by_ids("convos", ids, {"version": 1})
+    return etag_for(kind, sorted((conv["_id"], conv.get("version")) for conv in versions))
+
 @router.post("/get-convos")
-async def get_convos(req: GetConvos):
+async def get_convos(req: GetConvos, request: Request):
+    etag = await convos_etag("convos", req.ids)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
     convs = await db.find_by_ids("convos", req.ids)
-    return {"convos": convs}
+    return await json_response(request, {"convos": convs}, etag)
 
 @router.post("/get-messages")
-async def get_messages(req: GetMessages):
+async def get_messages(req: GetMessages, request: Request):
     if req.id == "new":
         try:
             user = await db.find("users", {'_id': ObjectId(req.userId)})
@@ -207,6 +270,12 @@ async def get_messages(req: GetMessages):
                 content={"error": "Conversation not found"},
                 status_code=404
             )
+
+        # Unchanged conversations are answered without reading any messages
+        etag = etag_for("messages", [(req.id, conv[0].get("version")), ("api_status", api_status)])
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
             
         msgs = await db.find_by_ids("Message", conv[0]['messages'])
         linkUploaded = False
@@ -214,7 +283,7 @@ async def get_messages(req: GetMessages):
             linkUploaded = True if len(conv[0]['links']) > 0 else False
             
         if conv[0].get("fileName"):
-            return {
+            return await json_response(request, {
                 "messages": msgs if msgs else None,
                 "file": {
                     "fileName": conv[0]["fileName"],
@@ -222,13 +291,13 @@ async def get_messages(req: GetMessages):
                 },
                 "api_status": api_status,
                 "linkUploaded": linkUploaded
-            }
-        return {
+            }, etag)
+        return await json_response(request, {
             "messages": msgs if msgs else None,
             "file": None,
             "api_status": api_status,
             "linkUploaded": linkUploaded
-        }
+        }, etag)
             
     except Exception as e:
         print(f"Error in get_messages: {str(e)}")
@@ -238,8 +307,12 @@ async def get_messages(req: GetMessages):
         )
 
 @router.post("/get-conv-details")
-async def get_conv_details(req: GetConvDetails):
-    convs = await db.find_by_ids("convos", req.ids)
+async def get_conv_details(req: GetConvDetails, request: Request):
+    etag = await convos_etag("conv-details", req.ids)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    convs = await db.find_by_ids("convos", req.ids, {"createTime": 1, "messages": 1, "fileName": 1})
     conv_data = [{"timestamp": conv["createTime"], "messageCount": len(conv["messages"])} for conv in convs]
     totalMessages, totalFiles = 0, 0
 
@@ -247,36 +320,41 @@ async def get_conv_details(req: GetConvDetails):
         totalMessages += len(conv["messages"])
         if conv["fileName"]:
             totalFiles += 1
-    return {"conv_data": conv_data, "totalMessages": totalMessages, "totalFiles": totalFiles}
+    return await json_response(request, {"conv_data": conv_data, "totalMessages": totalMessages, "totalFiles": totalFiles}, etag)
 
 @router.post("/remove-conv")
-async def deleteConv(req: DeleteConversatoin):
+async def deleteConv(req: DeleteConversatoin, background: BackgroundTasks):
     try:
         conv = await db.find('convos', {'_id': ObjectId(req.conv_id)})
         if not conv:
             return JSONResponse(content={"error": "Conversation not found"}, status_code=404)
-        if conv[0]['fileName']:
-            delete_index(req.conv_id)
         await db.remove("convos", req.conv_id)
+        await db.update("users", {"username": conv[0]["username"]}, {"$pull": {"convos": req.conv_id}})
+        # Messages and the vector index go after the response
+        background.add_task(cascade, req.conv_id, conv[0]["messages"])
         return JSONResponse(content={"success": "Succesfully deleted the conversation"}, status_code=200)
     except Exception as e:
         print(str(e))
         return JSONResponse(content={"error": "Something went wrong"}, status_code=400)
 
 @router.post("/upload-link")
-async def upload_link(req: UploadLink):
+async def upload_link(req: UploadLink, request: Request, claims: Optional[dict] = Depends(session)):
     isYoutube = req.link.startswith("https://youtu.be")
-    if (isYoutube):
-        return await upload_youtube_video(req.link, req.conv_id)
-    else:
-        return await upload_link_data(req.link, req.conv_id)
+    key = await ingest_key(request, claims, req.conv_id)
+    async def run():
+        async with admit(key, "ingest"):
+            if (isYoutube):
+                return await upload_youtube_video(req.link, req.conv_id)
+            else:
+                return await upload_link_data(req.link, req.conv_id)
+    return await links.do((req.conv_id, req.link.strip()), run)
 
 async def upload_youtube_video(video_url: str, conv_id: str):
     try:
         print(f"Received request to process YouTube video: {video_url}")
         
         # Get transcript
-        transcript_result = get_youtube_transcript(video_url)
+        transcript_result = await run_in_threadpool(get_youtube_transcript, video_url)
         
         if "error" in transcript_result:
             return JSONResponse(
@@ -290,7 +368,7 @@ async def upload_youtube_video(video_url: str, conv_id: str):
                 status_code=400
             )
             
-        update_index(file=None, fileType=None, text=transcript_result["transcript"], conv_id=conv_id)
+        await run_in_threadpool(update_index, file=None, fileType=None, text=transcript_result["transcript"], conv_id=conv_id, source="youtube")
         
         # Update conversation with video info
         await db.update("convos", 
@@ -301,7 +379,7 @@ async def upload_youtube_video(video_url: str, conv_id: str):
                     "linkUrl": video_url,
                     "linkType": "youtube_transcript"
                 }
-            }}
+            }, "$inc": {"version": 1, "indexVersion": 1}}
         )
         
         return {
@@ -319,7 +397,7 @@ async def upload_youtube_video(video_url: str, conv_id: str):
 
 async def upload_link_data(url: str, conv_id: str):
     try:
-        link_data = get_link_data(url, conv_id)
+        link_data = await run_in_threadpool(get_link_data, url, conv_id)
         if link_data.get("error"):
             return JSONResponse(
                 content={"error": link_data["error"]},
@@ -329,7 +407,7 @@ async def upload_link_data(url: str, conv_id: str):
             "linkName": "",
             "linkUrl": url,
             "linkType": "web_link"
-        }}})
+        }}, "$inc": {"version": 1, "indexVersion": 1}})
         return {
             "message": "success"
         }
@@ -338,4 +416,36 @@ async def upload_link_data(url: str, conv_id: str):
         return JSONResponse(
             content={"error": f"Error processing link data: {str(e)}"},
             status_code=400
-        )
\ No newline at end of file
+        )
+
+@router.get("/export")
+async def export_conversations(chunks: bool = False, claims: Optional[dict] = Depends(session)):
+    if not claims:
+        return JSONResponse(content={"error": "Sign in to export conversations"}, status_code=401)
+    return StreamingResponse(
+        export_lines(db.db, claims["name"], include_chunks=chunks),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": attachment(f"docquer-{claims['name']}.ndjson")}
+    )
+
+@router.post("/import")
+async def import_conversations(request: Request, file: UploadFile = File(...), claims: Optional[dict] = Depends(session)):
+    if not claims:
+        return JSONResponse(content={"error": "Sign in to import conversations"}, status_code=401)
+    async with admit(client_key(request, claims), "ingest"):
+        try:
+            report = await run_in_threadpool(import_lines, db.db, claims["name"], file.file)
+        except Exception as e:
+            print(f"Error importing conversations: {e}")
+            return JSONResponse(content={"error": f"Error importing conversations: {str(e)}"}, status_code=400)
+    return {"message": "success", **report}
+
+@router.post("/search")
+async def search(req: LibrarySearch, request: Request, claims: Optional[dict] = Depends(session)):
+    # Semantic search across the chunks of every conversation of the user
+    if not claims:
+        return JSONResponse(content={"error": "Sign in to search your library"}, status_code=401)
+    k = max(1, min(req.k, 50))
+    async with admit(client_key(request, claims), "file_chat"):
+        hits = await run_in_threadpool(search_library, db.db, claims["name"], req.query, k)
+    return {"results": hits}
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional, Set
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from starlette.concurrency import iterate_in_threadpool
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from llm.constants import normal_chat_main_content, get_index
+from llm.index_pool import index_name
+from llm.model import chat_model, document_prompt, stream_reply, title_recommender, subtitle_recommender
+from admission import admit
+from security import verify_token
+from routes.llm import db, write_turn
+
+# A WebSocket per open conversation. The user, API key, LLM client, vector
+# index handle and recent history are loaded once when the socket opens, so
+# a turn costs the model call plus one background write.
+#
+# Client -> server: {"type": "chat", "query": str, "mode": "normal" | "file"}
+# Server -> client: {"type": "ready"}, {"type": "token", "data": str},
+#                   {"type": "done", "messageIds": [str, str]}, {"type": "error", "error": str}
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "600"))
+SESSION_HISTORY_MESSAGES = int(os.getenv("SESSION_HISTORY_MESSAGES", "20"))
+SESSION_HISTORY_CHARS = int(os.getenv("SESSION_HISTORY_CHARS", "32000"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "200"))
+MAX_USER_SESSIONS = int(os.getenv("MAX_USER_SESSIONS", "4"))
+
+router = APIRouter()
+
+_sessions: Dict[str, int] = {}
+# Strong references to pending writes so they aren't garbage collected
+_writes: Set[asyncio.Task] = set()
+
+
+class Session:
+    def __init__(self, conv: dict, user: dict, claims: dict):
+        self.conv_id = str(conv["_id"])
+        self.username = user["username"]
+        self.key = f"user:{claims['sub']}"
+        self.api_key = user["groq_api_key"]
+        self.model = chat_model(self.api_key)
+        self.system = SystemMessage(content=normal_chat_main_content(self.username))
+        self.index = None
+        self.index_name = None
+        self.titled = len(conv["messages"]) > 0
+        self.history: Deque[BaseMessage] = deque()
+        self.chars = 0
+        # Turns are saved by background tasks; this keeps them in order even
+        # when the first one waits on the title calls
+        self.persisting = asyncio.Lock()
+
+    def remember(self, message: BaseMessage):
+        self.history.append(message)
+        self.chars += len(message.content)
+        while self.history and (len(self.history) > SESSION_HISTORY_MESSAGES or self.chars > SESSION_HISTORY_CHARS):
+            self.chars -= len(self.history.popleft().content)
+
+    def messages(self, prompt: str):
+        return [self.system, *self.history, HumanMessage(content=prompt)]
+
+
+async def open_session(conv_id: str, claims: dict) -> Session:
+    if not ObjectId.is_valid(conv_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    conv = await db.find("convos", {"_id": ObjectId(conv_id)})
+    user = await db.find("users", {"_id": ObjectId(claims["sub"])})
+    if not conv or not user or conv[0]["username"] != user[0]["username"]:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    session = Session(conv[0], user[0], claims)
+    recent = await db.find_by_ids("Message", conv[0]["messages"][-SESSION_HISTORY_MESSAGES:])
+    for message in sorted(recent, key=lambda m: m["_id"]):
+        if message["sender"] == "user":
+            session.remember(HumanMessage(content=message["text"]))
+        elif message["sender"] in ("bot", "ai"):
+            session.remember(AIMessage(content=message["text"]))
+    return session
+
+
+async def persist(session: Session, query: str, reply: str, message_ids):
+    docs = [
+        {"_id": message_ids[0], "sender": "user", "text": query, "createTime": datetime.now()},
+        {"_id": message_ids[1], "sender": "bot", "text": reply}
+    ]
+    async with session.persisting:
+        metadata = None
+        if not session.titled:
+            session.titled = True
+            title = await run_in_threadpool(title_recommender, session.api_key, query)
+            sub_title = await run_in_threadpool(subtitle_recommender, session.api_key, title, query)
+            metadata = {"firstMessage": query, "title": title, "subTitle": sub_title}
+        await write_turn(session.conv_id, docs, metadata)
+
+
+def _log_failure(task: asyncio.Task):
+    _writes.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"Error persisting session turn: {task.exception()}")
+
+
+async def turn(websocket: WebSocket, session: Session, query: str, mode: str):
+    async with admit(session.key, "file_chat" if mode == "file" else "chat"):
+        prompt = query
+        if mode == "file":
+            # The handle is kept while the conversation still owns that index;
+            # a pooled index may be claimed or recycled by another worker
+            name = await run_in_threadpool(index_name, session.conv_id)
+            if session.index is None or name != session.index_name:
+                session.index = await run_in_threadpool(get_index, session.conv_id)
+                session.index_name = name
+            prompt = await run_in_threadpool(document_prompt, session.index, query)
+            if prompt is None:
+                await websocket.send_json({"type": "error", "error": "No relevant context found to answer the query."})
+                return
+
+        parts = []
+        call = "file_chat" if mode == "file" else "chat"
+        async for token in iterate_in_threadpool(stream_reply(session.model, session.messages(prompt), call)):
+            parts.append(token)
+            await websocket.send_json({"type": "token", "data": token})
+
+    reply = "".join(parts)
+    message_ids = [ObjectId(), ObjectId()]
+    session.remember(HumanMessage(content=query))
+    session.remember(AIMessage(content=reply))
+    await websocket.send_json({"type": "done", "messageIds": [str(id) for id in message_ids]})
+
+    task = asyncio.create_task(persist(session, query, reply, message_ids))
+    _writes.add(task)
+    task.add_done_callback(_log_failure)
+
+
+@router.websocket("/chat/{conv_id}")
+async def chat_session(websocket: WebSocket, conv_id: str, token: Optional[str] = None):
+    # Browsers can't set headers on a WebSocket, so the session token comes
+    # in the query string
+    claims = verify_token(token)
+    if not claims:
+        await websocket.close(code=4401, reason="Invalid session")
+        return
+    user_id = claims["sub"]
+    if sum(_sessions.values()) >= MAX_SESSIONS or _sessions.get(user_id, 0) >= MAX_USER_SESSIONS:
+        await websocket.close(code=1013, reason="Too many sessions")
+        return
+
+    _sessions[user_id] = _sessions.get(user_id, 0) + 1
+    started = time.monotonic()
+    try:
+        await websocket.accept()
+        try:
+            session = await open_session(conv_id, claims)
+        except HTTPException as e:
+            await websocket.close(code=4404, reason=e.detail)
+            return
+        await websocket.send_json({"type": "ready"})
+
+        while True:
+            try:
+                data = await asyncio.wait_for(websocket.receive_json(), SESSION_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                await websocket.close(code=1000, reason="Idle timeout")
+                return
+            if not isinstance(data, dict):
+                data = {}
+            query = str(data.get("query") or "").strip()
+            if data.get("type") != "chat" or not query:
+                await websocket.send_json({"type": "error", "error": "Expected {\"type\": \"chat\", \"query\": ...}"})
+                continue
+            try:
+                await turn(websocket, session, query, data.get("mode", "normal"))
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "error": e.detail, "status": e.status_code})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print(f"Error in chat session {conv_id}: {e}")
+                await websocket.send_json({"type": "error", "error": "Something went wrong check the api"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _sessions[user_id] -= 1
+        if _sessions[user_id] == 0:
+            del _sessions[user_id]
+        print(f"Chat session {conv_id} closed after {time.monotonic() - started:.0f}s")
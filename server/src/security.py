@@ -0,0 +1,121 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import bcrypt
+from fastapi import Header
+
+# bcrypt burns ~200ms of CPU per call. It releases the GIL while hashing, so
+# a small dedicated thread pool keeps it off the event loop without the cost
+# of a process pool; HASH_CONCURRENCY also caps how many calls may queue up.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_CONCURRENCY = int(os.getenv("HASH_CONCURRENCY", str(HASH_WORKERS * 4)))
+
+# Signed session tokens: base64url(json claims) + "." + base64url(HMAC-SHA256).
+# Set SESSION_SECRET so tokens survive restarts and are valid on every worker.
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+
+# Google sign-in: the client sends the Firebase ID token it got from the
+# popup, and a session token is only issued once Google's signature and the
+# email in it check out
+FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID", "docquer-f9ecc")
+
+if not SESSION_SECRET:
+    print("SESSION_SECRET is not set, session tokens will only be valid for this process")
+    SESSION_SECRET = secrets.token_hex(32)
+
+_hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots: Optional[asyncio.Semaphore] = None
+
+
+async def _run_hash(fn, *args):
+    global _hash_slots
+    if _hash_slots is None:
+        _hash_slots = asyncio.Semaphore(HASH_CONCURRENCY)
+    async with _hash_slots:
+        return await asyncio.get_running_loop().run_in_executor(_hash_pool, fn, *args)
+
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+async def hash_password(password: str) -> str:
+    return await _run_hash(_hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hash(_verify, plain_password, hashed_password)
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64(hmac.new(SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id: str, username: str) -> str:
+    claims = {"sub": user_id, "name": username, "exp": int(time.time()) + SESSION_TTL}
+    payload = _b64(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token: Optional[str]) -> Optional[dict]:
+    if not token or "." not in token:
+        return None
+    payload, signature = token.rsplit(".", 1)
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        claims = json.loads(_unb64(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+async def session(authorization: Optional[str] = Header(None)) -> Optional[dict]:
+    """Dependency returning the verified session claims, or None."""
+    if authorization and authorization.lower().startswith("bearer "):
+        return verify_token(authorization[7:].strip())
+    return None
+
+
+def _verify_firebase(id_token: str) -> Optional[dict]:
+    from google.oauth2 import id_token as google_id_token
+    from google.auth.transport import requests
+    try:
+        return google_id_token.verify_firebase_token(id_token, requests.Request(), audience=FIREBASE_PROJECT_ID)
+    except Exception as e:
+        print(f"Rejected Firebase ID token: {e}")
+        return None
+
+
+async def verify_google_email(id_token: Optional[str], email: Optional[str]) -> bool:
+    """True when id_token is a valid Firebase ID token for this verified email."""
+    if not id_token or not email:
+        return False
+    # Fetching Google's signing certificates is blocking I/O
+    claims = await asyncio.get_running_loop().run_in_executor(None, _verify_firebase, id_token)
+    return bool(
+        claims and claims.get("email_verified")
+        and claims.get("email", "").lower() == email.lower()
+    )
@@ -0,0 +1,55 @@
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+from metrics import COALESCED
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    work and every duplicate that arrives while it runs awaits the same result
+    (or exception). The work runs in its own task, so a caller disconnecting
+    does not cancel it for the others.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            COALESCED.labels(self.operation).inc()
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+async def digest_upload(file, block_size: int = 1 << 20) -> str:
+    # Hashes an UploadFile block by block and rewinds it, so the body is
+    # only read into memory once the request has been admitted
+    hasher = hashlib.sha256()
+    while block := await file.read(block_size):
+        hasher.update(block)
+    await file.seek(0)
+    return hasher.hexdigest()
+
+
+uploads = SingleFlight("upload")
+links = SingleFlight("link")
+chats = SingleFlight("chat")
@@ -0,0 +1,186 @@
+import time
+from datetime import datetime
+from typing import IO, Iterator, List, Optional
+import orjson
+from bson import ObjectId
+from pymongo.database import Database
+from llm.constants import init_vector_db
+from llm.pipeline import insert_data, stored_chunks
+
+# Export format: one JSON object per line.
+#   {"type": "export", "version": 1, "username": str, "exportedAt": float}
+#   {"type": "conversation", "conversation": {...}}   followed by its
+#   {"type": "message", "conv_id": str, "message": {...}}   in order, then,
+#   when chunks are requested, {"type": "chunk", "conv_id": str, "chunk": {...}}
+# Conversations and messages are read through cursors and written as they
+# are read, so memory stays bounded whatever the size of the account.
+EXPORT_VERSION = 1
+CURSOR_BATCH = 500
+IMPORT_BATCH = 500
+IMPORT_CHUNK_BATCH = 1000
+
+
+def _line(obj: dict) -> bytes:
+    return orjson.dumps(obj, default=str) + b"\n"
+
+
+def export_lines(db: Database, username: str, include_chunks: bool = False) -> Iterator[bytes]:
+    yield _line({"type": "export", "version": EXPORT_VERSION, "username": username, "exportedAt": time.time()})
+    convos = db["convos"].find({"username": username}).sort("_id", 1).batch_size(CURSOR_BATCH)
+    for conv in convos:
+        conv_id = str(conv["_id"])
+        message_ids = conv.get("messages") or []
+        yield _line({"type": "conversation", "conversation": conv})
+
+        for start in range(0, len(message_ids), CURSOR_BATCH):
+            ids = message_ids[start:start + CURSOR_BATCH]
+            found = {str(m["_id"]): m for m in db["Message"].find({"_id": {"$in": [ObjectId(id) for id in ids]}})}
+            for id in ids:
+                if id in found:
+                    yield _line({"type": "message", "conv_id": conv_id, "message": found[id]})
+
+        if include_chunks and (conv.get("fileName") or conv.get("links")):
+            try:
+                for chunk in stored_chunks(conv_id):
+                    yield _line({"type": "chunk", "conv_id": conv_id, "chunk": chunk})
+            except Exception as e:
+                # A conversation whose index is gone still exports its messages
+                print(f"Error exporting chunks of {conv_id}: {e}")
+
+
+class _Importer:
+    def __init__(self, db: Database, username: str):
+        self.db = db
+        self.username = username
+        self.ids = {}
+        self.messages: List[dict] = []
+        self.message_conv: Optional[str] = None
+        self.chunks: List[dict] = []
+        self.chunk_conv: Optional[str] = None
+        self.indexed = set()
+        self.with_documents = set()
+        self.report = {"conversations": 0, "messages": 0, "chunks": 0, "skipped": 0, "unindexed": 0}
+
+    def conversation(self, conv: dict):
+        self.flush_messages()
+        self.flush_chunks()
+        new_id = ObjectId()
+        self.ids[str(conv.pop("_id"))] = str(new_id)
+        conv.update({"_id": new_id, "username": self.username, "messages": [], "version": 0})
+        conv["createTime"] = _timestamp(conv.get("createTime")) or datetime.now()
+        if conv.get("fileName") or conv.get("links"):
+            self.with_documents.add(str(new_id))
+        self.db["convos"].insert_one(conv)
+        self.db["users"].update_one({"username": self.username}, {"$push": {"convos": str(new_id)}})
+        self.report["conversations"] += 1
+
+    def message(self, conv_id: str, message: dict):
+        if self.message_conv != conv_id:
+            self.flush_messages()
+            self.message_conv = conv_id
+        message.pop("_id", None)
+        if "createTime" in message:
+            message["createTime"] = _timestamp(message["createTime"]) or datetime.now()
+        self.messages.append({**message, "_id": ObjectId()})
+        if len(self.messages) >= IMPORT_BATCH:
+            self.flush_messages()
+
+    def chunk(self, conv_id: str, chunk: dict):
+        if self.chunk_conv != conv_id:
+            self.flush_chunks()
+            self.chunk_conv = conv_id
+        self.chunks.append(chunk)
+        if len(self.chunks) >= IMPORT_CHUNK_BATCH:
+            self.flush_chunks()
+
+    def flush_messages(self):
+        if not self.messages:
+            return
+        self.db["Message"].insert_many(self.messages, ordered=True)
+        self.db["convos"].update_one(
+            {"_id": ObjectId(self.message_conv)},
+            {"$push": {"messages": {"$each": [str(m["_id"]) for m in self.messages]}}}
+        )
+        self.report["messages"] += len(self.messages)
+        self.messages = []
+
+    def flush_chunks(self):
+        if not self.chunks:
+            return
+        # Vectors are rebuilt with the current embedding model
+        if self.chunk_conv not in self.indexed:
+            init_vector_db(self.chunk_conv)
+            self.indexed.add(self.chunk_conv)
+        self.report["chunks"] += insert_data(self.chunk_conv, iter(self.chunks))
+        self.db["convos"].update_one({"_id": ObjectId(self.chunk_conv)}, {"$inc": {"indexVersion": 1}})
+        self.chunks = []
+
+    def finish(self):
+        self.flush_messages()
+        self.flush_chunks()
+        # A document conversation exported without its chunks has no index to
+        # answer from, so it comes back as a plain chat
+        unindexed = [ObjectId(id) for id in self.with_documents - self.indexed]
+        if unindexed:
+            self.db["convos"].update_many(
+                {"_id": {"$in": unindexed}},
+                {"$set": {"fileName": None, "fileMime": None, "links": []}}
+            )
+        self.report["unindexed"] = len(unindexed)
+
+
+def _timestamp(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _valid(kind: str, line: dict) -> bool:
+    # Checked before anything is written, so a bad line is skipped whole
+    match kind:
+        case "export":
+            return True
+        case "conversation":
+            conv = line.get("conversation")
+            return isinstance(conv, dict) and isinstance(conv.get("_id"), str) and ObjectId.is_valid(conv["_id"])
+        case "message":
+            message = line.get("message")
+            return isinstance(message, dict) and isinstance(message.get("sender"), str) and isinstance(message.get("text"), str)
+        case "chunk":
+            chunk = line.get("chunk")
+            # Chunks exported before provenance existed only carry their text
+            return (
+                isinstance(chunk, dict) and isinstance(chunk.get("text"), str) and bool(chunk["text"].strip())
+                and isinstance(chunk.get("page", 1), (int, float))
+            )
+    return False
+
+
+def import_lines(db: Database, username: str, file: IO[bytes]) -> dict:
+    importer = _Importer(db, username)
+    for raw in file:
+        if not raw.strip():
+            continue
+        try:
+            line = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            importer.report["skipped"] += 1
+            continue
+        kind = line.get("type") if isinstance(line, dict) else None
+        if not _valid(kind, line):
+            importer.report["skipped"] += 1
+            continue
+        conv_id = importer.ids.get(line.get("conv_id"))
+        if kind == "conversation":
+            importer.conversation(line["conversation"])
+        elif kind == "message" and conv_id:
+            importer.message(conv_id, line["message"])
+        elif kind == "chunk" and conv_id:
+            importer.chunk(conv_id, line["chunk"])
+        elif kind != "export":
+            importer.report["skipped"] += 1
+    importer.finish()
+    return importer.report
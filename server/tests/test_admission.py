@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+import admission
+from admission import Rejected, WeightedLimiter, admit
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_acquires_up_to_capacity():
+    async def scenario():
+        limiter = WeightedLimiter("test", capacity=4, max_waiters=0)
+        await limiter.acquire(3, timeout=0.1)
+        await limiter.acquire(1, timeout=0.1)
+        with pytest.raises(Rejected) as e:
+            await limiter.acquire(1, timeout=0.1)
+        assert e.value.reason == "queue_full"
+        limiter.release(3)
+        await limiter.acquire(3, timeout=0.1)
+        assert limiter.used == 4
+    run(scenario())
+
+
+def test_waiters_are_granted_in_order():
+    async def scenario():
+        limiter = WeightedLimiter("test", capacity=4, max_waiters=4)
+        await limiter.acquire(4, timeout=0.1)
+        granted = []
+
+        async def wait(name, weight):
+            await limiter.acquire(weight, timeout=1)
+            granted.append(name)
+
+        # A heavy request at the head isn't overtaken by a light one behind it
+        heavy = asyncio.create_task(wait("heavy", 3))
+        await asyncio.sleep(0)
+        light = asyncio.create_task(wait("light", 1))
+        await asyncio.sleep(0)
+        limiter.release(2)
+        await asyncio.sleep(0.01)
+        assert granted == []
+        limiter.release(2)
+        await asyncio.gather(heavy, light)
+        assert granted == ["heavy", "light"]
+        assert limiter.used == 4 and not limiter.waiters
+    run(scenario())
+
+
+def test_wait_times_out():
+    async def scenario():
+        limiter = WeightedLimiter("test", capacity=1, max_waiters=1)
+        await limiter.acquire(1, timeout=0.1)
+        with pytest.raises(Rejected) as e:
+            await limiter.acquire(1, timeout=0.05)
+        assert e.value.reason == "timeout"
+        assert not limiter.waiters
+        limiter.release(1)
+        assert limiter.idle()
+    run(scenario())
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(admission, "_global", WeightedLimiter("global", 8, 8))
+    monkeypatch.setattr(admission, "_users", {})
+    monkeypatch.setattr(admission, "USER_CAPACITY", 4)
+    monkeypatch.setattr(admission, "USER_QUEUE", 0)
+    monkeypatch.setattr(admission, "MAX_WAIT", 0.05)
+
+
+def test_rejection_is_a_429_with_retry_after(limits):
+    async def scenario():
+        async with admit("user:a", "ingest"):
+            with pytest.raises(HTTPException) as e:
+                async with admit("user:a", "chat"):
+                    pass
+            assert e.value.status_code == 429
+            assert int(e.value.headers["Retry-After"]) >= 1
+            # Another user still has budget
+            async with admit("user:b", "chat"):
+                pass
+    run(scenario())
+
+
+def test_per_user_state_is_dropped_when_idle(limits):
+    async def scenario():
+        async with admit("user:a", "chat"):
+            assert "user:a" in admission._users
+        assert admission._users == {}
+        assert admission._global.idle()
+
+        with pytest.raises(RuntimeError):
+            async with admit("user:a", "chat"):
+                raise RuntimeError("handler failed")
+        assert admission._users == {}
+        assert admission._global.idle()
+    run(scenario())
@@ -0,0 +1,50 @@
+import pytest
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from llm import constants
+from llm.constants import stream_chunks
+
+
+@pytest.fixture
+def word_splitter(monkeypatch):
+    # Stands in for the tokenizer splitter: lengths and overlap are counted
+    # in words, so they differ from character offsets like tokens do
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=100, chunk_overlap=24, length_function=lambda text: len(text.split())
+    )
+    monkeypatch.setattr(constants, "_text_splitter", splitter)
+    return splitter
+
+
+def pages(count: int, words: int):
+    for page in range(1, count + 1):
+        text = " ".join(f"p{page}w{i}" for i in range(words))
+        yield {"text": text, "source": "pdf", "page": page, "ocr": page == 2}
+
+
+def span(chunk: dict):
+    # Pages whose words appear in the chunk
+    found = sorted({int(word[1:word.index("w")]) for word in chunk["text"].split()})
+    return found[0], found[-1]
+
+
+def test_chunks_cite_the_pages_they_come_from(word_splitter):
+    chunks = list(stream_chunks(pages(3, 400)))
+    assert len(chunks) > 12
+    for chunk in chunks:
+        first, last = span(chunk)
+        assert chunk["page"] == first
+        assert chunk.get("page_end", first) == last
+        assert chunk["ocr"] == (first <= 2 <= last)
+
+
+def test_chunks_cover_every_page(word_splitter):
+    chunks = list(stream_chunks(pages(3, 400)))
+    assert {chunk["page"] for chunk in chunks} == {1, 2, 3}
+    words = {word for chunk in chunks for word in chunk["text"].split()}
+    assert words == {word for rec in pages(3, 400) for word in rec["text"].split()}
+
+
+def test_short_pages_are_merged(word_splitter):
+    chunks = list(stream_chunks(pages(4, 10)))
+    assert len(chunks) == 1
+    assert (chunks[0]["page"], chunks[0]["page_end"]) == (1, 4)
@@ -0,0 +1,116 @@
+import threading
+import pytest
+from llm import writer
+from llm.writer import BulkWriter, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+class RecordingIndex:
+    """Records upserted batches; `failures` are raised by the first calls."""
+
+    def __init__(self, failures=(), max_vectors=None):
+        self.failures = list(failures)
+        self.max_vectors = max_vectors
+        self.batches = []
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def upsert(self, vectors):
+        with self.lock:
+            self.calls += 1
+            if self.max_vectors and len(vectors) > self.max_vectors:
+                raise StatusError(413)
+            if self.failures:
+                raise self.failures.pop(0)
+            self.batches.append([vector["id"] for vector in vectors])
+
+
+def vectors(count: int):
+    return [{"id": str(i), "values": [0.0] * 4, "metadata": {"page": 1}} for i in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(writer, "BACKOFF_BASE", 0.0)
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (StatusError(400), False),
+    (ConnectionResetError(), True),
+    (TimeoutError(), True),
+    (TypeError("bad vector"), False),
+    (ValueError("bad vector"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) == retryable
+
+
+def test_transient_failures_are_retried():
+    index = RecordingIndex(failures=[StatusError(503), ConnectionResetError()])
+    bulk = BulkWriter(index, max_vectors=10)
+    bulk.add_many(vectors(5))
+    report = bulk.close()
+    assert index.batches == [["0", "1", "2", "3", "4"]]
+    assert report["retries"] == 2
+    assert report["vectors"] == 5
+
+
+def test_permanent_failures_are_not_retried():
+    index = RecordingIndex(failures=[ValueError("malformed")])
+    bulk = BulkWriter(index, max_vectors=10)
+    bulk.add_many(vectors(3))
+    with pytest.raises(ValueError):
+        bulk.close()
+    assert index.calls == 1
+
+
+def test_gives_up_after_max_retries():
+    index = RecordingIndex(failures=[StatusError(500)] * (writer.MAX_RETRIES + 1))
+    bulk = BulkWriter(index, max_vectors=10)
+    bulk.add_many(vectors(2))
+    with pytest.raises(StatusError):
+        bulk.close()
+    assert index.calls == writer.MAX_RETRIES + 1
+
+
+def test_batches_respect_vector_and_byte_limits():
+    index = RecordingIndex()
+    bulk = BulkWriter(index, max_vectors=4)
+    bulk.add_many(vectors(10))
+    bulk.close()
+    assert max(len(batch) for batch in index.batches) <= 4
+    assert sorted(id for batch in index.batches for id in batch) == sorted(str(i) for i in range(10))
+
+    index = RecordingIndex()
+    one = writer.estimate_size(vectors(1)[0])
+    bulk = BulkWriter(index, max_vectors=100, max_bytes=one * 3)
+    bulk.add_many(vectors(7))
+    bulk.close()
+    assert max(len(batch) for batch in index.batches) <= 3
+
+
+def test_too_large_batches_are_split():
+    index = RecordingIndex(max_vectors=2)
+    bulk = BulkWriter(index, max_vectors=8)
+    bulk.add_many(vectors(8))
+    report = bulk.close()
+    assert all(len(batch) <= 2 for batch in index.batches)
+    assert sorted(id for batch in index.batches for id in batch) == sorted(str(i) for i in range(8))
+    assert report["vectors"] == 8
+
+
+def test_close_flushes_the_partial_batch():
+    index = RecordingIndex()
+    bulk = BulkWriter(index, max_vectors=100)
+    bulk.add_many(vectors(3))
+    assert index.batches == []
+    report = bulk.close()
+    assert index.batches == [["0", "1", "2"]]
+    assert report["batches"] == 1